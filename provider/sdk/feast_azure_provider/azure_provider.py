@@ -1,10 +1,28 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT license.
 
+import asyncio
+import logging
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime
-from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+from functools import partial
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 import pandas
+import pyarrow
 from tqdm import tqdm
 
 from feast import FeatureTable
@@ -12,24 +30,117 @@ from feast.entity import Entity
 from feast.feature_view import FeatureView
 from feast.infra.offline_stores.offline_utils import get_offline_store_from_config
 from feast.infra.online_stores.helpers import get_online_store_from_config
+from feast.infra.key_encoding_utils import serialize_entity_key
+from feast.infra.online_stores.redis import RedisOnlineStore, RedisType
 from feast.infra.provider import (
     Provider,
     RetrievalJob,
-    _convert_arrow_to_proto,
     _get_column_names,
     _run_field_mapping,
 )
+from feast.protos.feast.core.FeatureView_pb2 import FeatureView as FeatureViewProto
 from feast.protos.feast.types.EntityKey_pb2 import EntityKey as EntityKeyProto
 from feast.protos.feast.types.Value_pb2 import Value as ValueProto
 from feast.registry import Registry
-from feast.repo_config import RepoConfig
+from feast.repo_config import FeastConfigBaseModel, RepoConfig
+
+from .mssqlserver import Watermark
+from .online_cache import OnlineFeatureCache
+from .proto_conversion import (
+    convert_arrow_to_proto,
+    serialize_arrow_for_redis,
+    write_serialized_rows_to_redis,
+)
+from .redis_online import (
+    create_async_redis_client,
+    read_from_redis,
+    read_from_redis_async,
+)
+
+logger = logging.getLogger(__name__)
+
+# Number of entity keys read from the online store per round trip
+ONLINE_READ_BATCH_SIZE = 100
+
+# Maximum number of batches of a single online_read call read concurrently
+ONLINE_READ_PARALLELISM = 8
+
+# Size of the connection pool of the asyncio Redis client used by online_read_async
+ONLINE_READ_ASYNC_MAX_CONNECTIONS = 64
+
+# A materialization chunk that failed is retried after a random wait of up to
+# MATERIALIZATION_RETRY_BACKOFF_FACTOR * 2 ** attempt seconds, capped at
+# MATERIALIZATION_RETRY_BACKOFF_MAX seconds
+MATERIALIZATION_RETRY_BACKOFF_FACTOR = 1.0
+MATERIALIZATION_RETRY_BACKOFF_MAX = 60.0
+
+
+class AzureProviderConfig(FeastConfigBaseModel):
+    """
+    Settings of AzureProvider, read from the provider_options section of
+    feature_store.yaml:
+
+        provider: feast_azure_provider.azure_provider.AzureProvider
+        provider_options:
+            online_cache_max_bytes: 268435456
+    """
+
+    online_cache_max_bytes: int = 0
+    """Memory budget of the in-process cache AzureProvider.online_read keeps in front of the online
+     store, 0 disables it. Rows of feature views with a ttl are cached for that ttl and dropped when
+     the feature view is materialized by the same process"""
+
+    materialization_chunks: int = 1
+    """Number of entity hash partitions a feature view is split into for materialization"""
+
+    materialization_parallelism: int = 4
+    """Maximum number of materialization chunks pulled, converted and written concurrently"""
+
+    materialization_processes: int = 1
+    """Number of worker processes the chunks of materialized feature views are spread over. Every
+     worker opens its own database and online store connections. FeatureStore.materialize starts
+     a pool of workers for every feature view, as it materializes one feature view at a time.
+     AzureProvider.materialize_feature_views shares one pool between all the feature views it is
+     given, so chunks of different feature views are materialized concurrently"""
+
+    materialization_retries: int = 2
+    """Number of times a chunk that failed in a materialization worker process is retried"""
+
+    incremental_materialization: bool = False
+    """Only materialize entities with rows newer than the watermark recorded by the previous
+     materialization of the feature view. The watermark is the source's watermark_column if set,
+     e.g. a rowversion column, and its created_timestamp_column otherwise. Rows must get increasing
+     watermarks as they are written, and materialization should run up to the current time"""
+
+    @classmethod
+    def from_repo_config(cls, config: RepoConfig) -> "AzureProviderConfig":
+        options = getattr(config, "provider_options", None) or {}
+        if isinstance(options, cls):
+            return options
+        return cls(**options)
 
 
 class AzureProvider(Provider):
     def __init__(self, config: RepoConfig):
         self.repo_config = config
+        self.provider_config = AzureProviderConfig.from_repo_config(config)
         self.offline_store = get_offline_store_from_config(config.offline_store)
         self.online_store = get_online_store_from_config(config.online_store)
+        self._read_executor = ThreadPoolExecutor(max_workers=ONLINE_READ_PARALLELISM)
+        # Runs the blocking reads of online_read_async. They wait for batches queued on
+        # _read_executor, so running them on that pool could leave every worker waiting
+        # for batches no worker is free to read.
+        self._async_read_executor = ThreadPoolExecutor(
+            max_workers=ONLINE_READ_PARALLELISM
+        )
+        self._async_redis_client = None
+
+        online_cache_max_bytes = self.provider_config.online_cache_max_bytes
+        self.online_cache = (
+            OnlineFeatureCache(online_cache_max_bytes)
+            if online_cache_max_bytes > 0
+            else None
+        )
 
     def update_infra(
         self,
@@ -75,10 +186,191 @@ class AzureProvider(Provider):
         entity_keys: List[EntityKeyProto],
         requested_features: List[str] = None,
     ) -> List[Tuple[Optional[datetime], Optional[Dict[str, ValueProto]]]]:
-        result = self.online_store.online_read(config, table, entity_keys)
+        if not requested_features:
+            requested_features = [feature.name for feature in table.features]
+
+        ttl = getattr(table, "ttl", None)
+        if self.online_cache is None or not ttl:
+            return self._read_online_store(
+                config, table, entity_keys, requested_features
+            )
+
+        cache_keys, result, missing = self._read_online_cache(
+            table, entity_keys, requested_features
+        )
+        if missing:
+            rows = self._read_online_store(
+                config,
+                table,
+                [entity_keys[idx] for idx in missing],
+                requested_features,
+            )
+            self._fill_online_cache(table, cache_keys, result, missing, rows)
+        return result
 
+    async def online_read_async(
+        self,
+        config: RepoConfig,
+        table: Union[FeatureTable, FeatureView],
+        entity_keys: List[EntityKeyProto],
+        requested_features: List[str] = None,
+    ) -> List[Tuple[Optional[datetime], Optional[Dict[str, ValueProto]]]]:
+        """
+        Asynchronous online_read. Standalone Redis is read with an asyncio client and a
+        pool of ONLINE_READ_ASYNC_MAX_CONNECTIONS connections, other online stores are
+        read on the provider's thread pool.
+        """
+        if not requested_features:
+            requested_features = [feature.name for feature in table.features]
+
+        ttl = getattr(table, "ttl", None)
+        if self.online_cache is None or not ttl:
+            return await self._read_online_store_async(
+                config, table, entity_keys, requested_features
+            )
+
+        cache_keys, result, missing = self._read_online_cache(
+            table, entity_keys, requested_features
+        )
+        if missing:
+            rows = await self._read_online_store_async(
+                config,
+                table,
+                [entity_keys[idx] for idx in missing],
+                requested_features,
+            )
+            self._fill_online_cache(table, cache_keys, result, missing, rows)
         return result
 
+    def _read_online_cache(
+        self,
+        table: Union[FeatureTable, FeatureView],
+        entity_keys: List[EntityKeyProto],
+        requested_features: List[str],
+    ) -> Tuple[List[bytes], List[Any], List[int]]:
+        """Returns the cache keys, the cached rows and the indices of the cache misses"""
+        cache_keys = [serialize_entity_key(entity_key) for entity_key in entity_keys]
+        result = [
+            self.online_cache.get(table.name, cache_key, requested_features)
+            for cache_key in cache_keys
+        ]
+        missing = [idx for idx, row in enumerate(result) if row is None]
+        return cache_keys, result, missing
+
+    def _fill_online_cache(
+        self,
+        table: Union[FeatureTable, FeatureView],
+        cache_keys: List[bytes],
+        result: List[Any],
+        missing: List[int],
+        rows: List[Tuple[Optional[datetime], Optional[Dict[str, ValueProto]]]],
+    ) -> None:
+        for idx, row in zip(missing, rows):
+            result[idx] = row
+            self.online_cache.put(table.name, cache_keys[idx], row, table.ttl)
+
+    async def _read_online_store_async(
+        self,
+        config: RepoConfig,
+        table: Union[FeatureTable, FeatureView],
+        entity_keys: List[EntityKeyProto],
+        requested_features: List[str],
+    ) -> List[Tuple[Optional[datetime], Optional[Dict[str, ValueProto]]]]:
+        if (
+            not isinstance(self.online_store, RedisOnlineStore)
+            or config.online_store.redis_type != RedisType.redis
+        ):
+            return await asyncio.get_running_loop().run_in_executor(
+                self._async_read_executor,
+                partial(
+                    self._read_online_store,
+                    config,
+                    table,
+                    entity_keys,
+                    requested_features,
+                ),
+            )
+
+        if self._async_redis_client is None:
+            self._async_redis_client = create_async_redis_client(
+                config.online_store.connection_string,
+                ONLINE_READ_ASYNC_MAX_CONNECTIONS,
+            )
+        batches = await asyncio.gather(
+            *(
+                read_from_redis_async(
+                    self._async_redis_client,
+                    config.project,
+                    table.name,
+                    entity_keys[start : start + ONLINE_READ_BATCH_SIZE],
+                    requested_features,
+                )
+                for start in range(0, len(entity_keys), ONLINE_READ_BATCH_SIZE)
+            )
+        )
+        return [row for rows in batches for row in rows]
+
+    def _read_online_store(
+        self,
+        config: RepoConfig,
+        table: Union[FeatureTable, FeatureView],
+        entity_keys: List[EntityKeyProto],
+        requested_features: List[str],
+    ) -> List[Tuple[Optional[datetime], Optional[Dict[str, ValueProto]]]]:
+        if isinstance(self.online_store, RedisOnlineStore):
+            client = self.online_store._get_client(config.online_store)
+            read_batch = partial(
+                read_from_redis,
+                client,
+                config.project,
+                table.name,
+                requested_features=requested_features,
+            )
+        else:
+            read_batch = partial(
+                self.online_store.online_read,
+                config,
+                table,
+                requested_features=requested_features,
+            )
+
+        # Large key lists are split into batches that are read concurrently
+        batches = [
+            entity_keys[start : start + ONLINE_READ_BATCH_SIZE]
+            for start in range(0, len(entity_keys), ONLINE_READ_BATCH_SIZE)
+        ]
+        if len(batches) <= 1:
+            return read_batch(entity_keys)
+        result = []
+        for rows in self._read_executor.map(read_batch, batches):
+            result.extend(rows)
+        return result
+
+    def online_write_arrow(
+        self,
+        config: RepoConfig,
+        feature_view: FeatureView,
+        table: pyarrow.Table,
+        join_keys: List[str],
+        progress: Optional[Callable[[int], Any]],
+    ) -> None:
+        """
+        Writes the rows of an Arrow table to the online store. Rows for Redis are
+        serialized straight from the table and written with pipelined HSETs, other
+        online stores are given protos converted column by column.
+        """
+        if table.num_rows == 0:
+            return
+        if isinstance(self.online_store, RedisOnlineStore):
+            client = self.online_store._get_client(config.online_store)
+            rows = serialize_arrow_for_redis(
+                table, feature_view, join_keys, config.project
+            )
+            write_serialized_rows_to_redis(client, rows, progress)
+        else:
+            rows_to_write = convert_arrow_to_proto(table, feature_view, join_keys)
+            self.online_write_batch(config, feature_view, rows_to_write, progress)
+
     def materialize_single_feature_view(
         self,
         config: RepoConfig,
@@ -89,17 +381,239 @@ class AzureProvider(Provider):
         project: str,
         tqdm_builder: Callable[[int], tqdm],
     ) -> None:
+        plan = self._plan_materialization(config, feature_view, registry, project)
+        if plan is None:
+            return
+        if self.provider_config.materialization_processes > 1:
+            self._materialize_on_workers(
+                config,
+                {feature_view.name: (feature_view, plan)},
+                start_date,
+                end_date,
+                project,
+                tqdm_builder,
+                lambda feature_view: None,
+            )
+            return
+
+        # Entities are split into partitions by hashing their join keys, so every
+        # chunk holds the latest rows of a disjoint set of entities and chunks can
+        # be written to the online store in any order.
+        partitions = _get_entity_hash_partitions(self.provider_config, plan)
+        if partitions == [None]:
+            table = self._pull_materialization_chunk(
+                config, feature_view, plan, start_date, end_date, None
+            )
+            with tqdm_builder(table.num_rows) as pbar:
+                self.online_write_arrow(
+                    self.repo_config,
+                    feature_view,
+                    table,
+                    plan.join_keys,
+                    lambda x: pbar.update(x),
+                )
+        else:
+            with tqdm_builder(len(partitions)) as pbar, ThreadPoolExecutor(
+                max_workers=self.provider_config.materialization_parallelism
+            ) as executor:
+                futures = [
+                    executor.submit(
+                        self._materialize_chunk,
+                        config,
+                        feature_view,
+                        plan,
+                        start_date,
+                        end_date,
+                        partition,
+                    )
+                    for partition in partitions
+                ]
+                for future in as_completed(futures):
+                    future.result()
+                    pbar.update(1)
+
+        self._record_materialization(config, feature_view, plan, project)
+
+    def materialize_feature_views(
+        self,
+        config: RepoConfig,
+        feature_views: List[FeatureView],
+        start_date: datetime,
+        end_date: datetime,
+        registry: Registry,
+        project: str,
+        tqdm_builder: Callable[[int], tqdm],
+    ) -> None:
+        """
+        Materializes several feature views at once on a pool of materialization_processes
+        worker processes. The entity hash partitions of all feature views are spread over
+        the same workers, and the materialized interval of a feature view is recorded in
+        the registry once all of its chunks are written.
+
+        FeatureStore.materialize materializes one feature view at a time, each on a pool
+        of its own, so materializing many feature views together is called directly:
+
+            store._get_provider().materialize_feature_views(
+                store.config,
+                [store.get_feature_view(name) for name in names],
+                start_date,
+                end_date,
+                store._registry,
+                store.project,
+                lambda length: tqdm(total=length, ncols=100),
+            )
+        """
+        if self.provider_config.materialization_processes <= 1:
+            for feature_view in feature_views:
+                self.materialize_single_feature_view(
+                    config,
+                    feature_view,
+                    start_date,
+                    end_date,
+                    registry,
+                    project,
+                    tqdm_builder,
+                )
+                registry.apply_materialization(
+                    feature_view, project, start_date, end_date
+                )
+            return
+
+        plans = {}
+        for feature_view in feature_views:
+            plan = self._plan_materialization(config, feature_view, registry, project)
+            if plan is not None:
+                plans[feature_view.name] = (feature_view, plan)
+            else:
+                registry.apply_materialization(
+                    feature_view, project, start_date, end_date
+                )
+
+        self._materialize_on_workers(
+            config,
+            plans,
+            start_date,
+            end_date,
+            project,
+            tqdm_builder,
+            lambda feature_view: registry.apply_materialization(
+                feature_view, project, start_date, end_date
+            ),
+        )
+
+    def _materialize_on_workers(
+        self,
+        config: RepoConfig,
+        plans: Dict[str, Tuple[FeatureView, "_MaterializationPlan"]],
+        start_date: datetime,
+        end_date: datetime,
+        project: str,
+        tqdm_builder: Callable[[int], tqdm],
+        on_materialized: Callable[[FeatureView], None],
+    ) -> None:
+        """
+        Materializes the chunks of feature views on a pool of materialization_processes
+        worker processes, retrying a chunk that fails up to materialization_retries
+        times. on_materialized is called for every feature view all of whose chunks
+        are written.
+        """
+        retries = self.provider_config.materialization_retries
+        tasks = [
+            (
+                feature_view.name,
+                (
+                    feature_view.to_proto().SerializeToString(),
+                    plan,
+                    start_date,
+                    end_date,
+                    partition,
+                    retries,
+                ),
+            )
+            for feature_view, plan in plans.values()
+            for partition in _get_entity_hash_partitions(self.provider_config, plan)
+        ]
+        # A feature view's watermark is recorded once all of its chunks are written
+        remaining_chunks = Counter(name for name, _ in tasks)
+        with tqdm_builder(len(tasks)) as pbar, ProcessPoolExecutor(
+            max_workers=self.provider_config.materialization_processes,
+            initializer=_init_materialization_worker,
+            initargs=(config,),
+        ) as executor:
+            futures = {
+                executor.submit(_materialize_chunk_in_worker, *args): name
+                for name, args in tasks
+            }
+            for future in as_completed(futures):
+                future.result()
+                pbar.update(1)
+                name = futures[future]
+                remaining_chunks[name] -= 1
+                if remaining_chunks[name] == 0:
+                    feature_view, plan = plans[name]
+                    self._record_materialization(config, feature_view, plan, project)
+                    on_materialized(feature_view)
+
+    def _plan_materialization(
+        self,
+        config: RepoConfig,
+        feature_view: FeatureView,
+        registry: Registry,
+        project: str,
+    ) -> Optional["_MaterializationPlan"]:
+        """Returns how a feature view is pulled, or None if it has nothing new to materialize"""
         entities = []
         for entity_name in feature_view.entities:
             entities.append(registry.get_entity(entity_name, project))
 
+        column_names = _get_column_names(feature_view, entities)
+        join_keys = [entity.join_key for entity in entities]
+
+        # With incremental materialization only entities that changed since the
+        # watermark recorded by the previous run are pulled
+        pull_kwargs = {}
+        watermark_column = None
+        current_watermark = None
+        if self.provider_config.incremental_materialization:
+            watermark_column = (
+                getattr(feature_view.batch_source, "watermark_column", None)
+                or column_names[3]
+            )
+        if watermark_column:
+            previous_watermark = self.offline_store.get_materialization_watermark(
+                config, project, feature_view.name
+            )
+            current_watermark = self.offline_store.get_current_watermark(
+                config, feature_view.batch_source, watermark_column
+            )
+            if current_watermark is None or previous_watermark == current_watermark:
+                return None
+            if previous_watermark is not None:
+                pull_kwargs["changed_since"] = (watermark_column, previous_watermark)
+
+        return _MaterializationPlan(
+            column_names, join_keys, pull_kwargs, current_watermark
+        )
+
+    def _pull_materialization_chunk(
+        self,
+        config: RepoConfig,
+        feature_view: FeatureView,
+        plan: "_MaterializationPlan",
+        start_date: datetime,
+        end_date: datetime,
+        entity_hash_partition: Optional[Tuple[int, int]],
+    ) -> pyarrow.Table:
         (
             join_key_columns,
             feature_name_columns,
             event_timestamp_column,
             created_timestamp_column,
-        ) = _get_column_names(feature_view, entities)
+        ) = plan.column_names
 
+        kwargs = dict(plan.pull_kwargs)
+        if entity_hash_partition is not None:
+            kwargs["entity_hash_partition"] = entity_hash_partition
         offline_job = self.offline_store.pull_latest_from_table_or_query(
             config=config,
             data_source=feature_view.batch_source,
@@ -109,6 +623,7 @@ class AzureProvider(Provider):
             created_timestamp_column=created_timestamp_column,
             start_date=start_date,
             end_date=end_date,
+            **kwargs,
         )
 
         table = offline_job.to_arrow()
@@ -116,12 +631,36 @@ class AzureProvider(Provider):
         if feature_view.batch_source.field_mapping is not None:
             table = _run_field_mapping(table, feature_view.batch_source.field_mapping)
 
-        join_keys = [entity.join_key for entity in entities]
-        rows_to_write = _convert_arrow_to_proto(table, feature_view, join_keys)
+        return table
 
-        with tqdm_builder(len(rows_to_write)) as pbar:
-            self.online_write_batch(
-                self.repo_config, feature_view, rows_to_write, lambda x: pbar.update(x)
+    def _materialize_chunk(
+        self,
+        config: RepoConfig,
+        feature_view: FeatureView,
+        plan: "_MaterializationPlan",
+        start_date: datetime,
+        end_date: datetime,
+        entity_hash_partition: Optional[Tuple[int, int]],
+    ) -> None:
+        table = self._pull_materialization_chunk(
+            config, feature_view, plan, start_date, end_date, entity_hash_partition
+        )
+        self.online_write_arrow(
+            self.repo_config, feature_view, table, plan.join_keys, None
+        )
+
+    def _record_materialization(
+        self,
+        config: RepoConfig,
+        feature_view: FeatureView,
+        plan: "_MaterializationPlan",
+        project: str,
+    ) -> None:
+        if self.online_cache is not None:
+            self.online_cache.invalidate(feature_view.name)
+        if plan.current_watermark is not None:
+            self.offline_store.update_materialization_watermark(
+                config, project, feature_view.name, plan.current_watermark
             )
 
     def get_historical_features(
@@ -144,3 +683,78 @@ class AzureProvider(Provider):
             full_feature_names=full_feature_names,
         )
         return job
+
+
+class _MaterializationPlan(NamedTuple):
+    """What materializing a feature view pulls from the offline store"""
+
+    column_names: Tuple[List[str], List[str], str, Optional[str]]
+    join_keys: List[str]
+    pull_kwargs: Dict[str, Any]
+    current_watermark: Optional[Watermark]
+
+
+def _get_entity_hash_partitions(
+    provider_config: AzureProviderConfig, plan: _MaterializationPlan
+) -> List[Optional[Tuple[int, int]]]:
+    num_chunks = provider_config.materialization_chunks
+    if num_chunks <= 1 or not plan.column_names[0]:
+        return [None]
+    return [(chunk, num_chunks) for chunk in range(num_chunks)]
+
+
+# Provider of a materialization worker process, created by _init_materialization_worker
+_worker_provider: Optional[AzureProvider] = None
+
+
+def _init_materialization_worker(config: RepoConfig) -> None:
+    # Engines and online store clients must not be shared with the parent process,
+    # so every worker builds its own provider
+    global _worker_provider
+    _worker_provider = AzureProvider(config)
+
+
+def _materialize_chunk_in_worker(
+    feature_view_proto: bytes,
+    plan: _MaterializationPlan,
+    start_date: datetime,
+    end_date: datetime,
+    entity_hash_partition: Optional[Tuple[int, int]],
+    retries: int,
+) -> None:
+    feature_view = FeatureView.from_proto(
+        FeatureViewProto.FromString(feature_view_proto)
+    )
+    config = _worker_provider.repo_config
+    for attempt in range(retries + 1):
+        try:
+            _worker_provider._materialize_chunk(
+                config,
+                feature_view,
+                plan,
+                start_date,
+                end_date,
+                entity_hash_partition,
+            )
+            return
+        except Exception:
+            if attempt == retries:
+                raise
+            logger.warning(
+                f"Materializing chunk {entity_hash_partition} of {feature_view.name} "
+                f"failed, retrying",
+                exc_info=True,
+            )
+            time.sleep(_retry_backoff(attempt))
+
+
+def _retry_backoff(attempt: int) -> float:
+    # Random waits spread the retries of workers that failed together, e.g. when
+    # the database was briefly unavailable
+    return random.uniform(
+        0,
+        min(
+            MATERIALIZATION_RETRY_BACKOFF_MAX,
+            MATERIALIZATION_RETRY_BACKOFF_FACTOR * 2 ** attempt,
+        ),
+    )
@@ -0,0 +1,38 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import os
+import threading
+from typing import Any, Dict, Tuple
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+
+# Engines shared by everything in the process that connects to the same database with
+# the same engine options. Keys include the process id, so processes forked after an
+# engine was created build their own engine instead of sharing pooled connections with
+# their parent.
+_engines: Dict[Tuple[int, str, Tuple[Tuple[str, Any], ...]], Engine] = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(connection_string: str, **engine_options: Any) -> Engine:
+    """
+    Returns the process-wide engine for a connection string and engine_options, e.g.
+    pool_size or fast_executemany, creating it if it doesn't exist yet
+    """
+    key = (os.getpid(), connection_string, tuple(sorted(engine_options.items())))
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = create_engine(connection_string, **engine_options)
+            _engines[key] = engine
+    return engine
+
+
+def dispose_engines() -> None:
+    """Closes the pooled connections of all engines and forgets them"""
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
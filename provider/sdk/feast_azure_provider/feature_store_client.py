@@ -1,13 +1,15 @@
 import os
 import warnings
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from collections import Counter, OrderedDict, defaultdict
-import requests
 from datetime import datetime, timedelta
 from pathlib import Path
 import json
-from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union, cast
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Set, Tuple, Union, cast
 import base64
+import hashlib
 import logging
+import threading
 
 from feast.repo_config import RepoConfig, RegistryConfig
 from feast.registry import Registry
@@ -29,17 +31,26 @@ from feast.protos.feast.core.Entity_pb2 import Entity as EntityV2Proto
 from feast.protos.feast.core.FeatureView_pb2 import FeatureView as FeatureViewProto
 from feast.protos.feast.core.FeatureService_pb2 import FeatureService as FeatureServiceProto
 
-from feast_azure_provider.mssqlserver import MsSqlServerOfflineStoreConfig
-from feast.infra.online_stores.redis import RedisOnlineStoreConfig
 from feast.value_type import ValueType
-from azure.identity import DeviceCodeCredential, EnvironmentCredential, ChainedTokenCredential, AzureCliCredential
-from azure.core.exceptions import ClientAuthenticationError
-import msal
+
+from feast_azure_provider.registry_snapshot import write_registry_snapshot
+
+# The store configs, msal, azure.identity and requests are imported when first used,
+# importing this module only loads feast
+if TYPE_CHECKING:
+    from feast_azure_provider.mssqlserver import MsSqlServerOfflineStoreConfig
+    from feast.infra.online_stores.redis import RedisOnlineStoreConfig
 
 
 SQL_OFFLINE_STORE_TYPE = "feast_azure_provider.mssqlserver.MsSqlServerOfflineStore"
 RESID_ONLINE_STORE_TYPE = "redis";
 
+# Responses of the core service on which a request is retried
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+
+# Number of objects apply_all sends to the core service concurrently
+DEFAULT_APPLY_PARALLELISM = 8
+
 class FeastCoreResponseError(Exception):
 
     status_code: int
@@ -62,7 +73,17 @@ class FeatureStoreClient():
         aad_auth: bool = False,
         aad_tenant_id: str = None,
         aad_client_id: str = None,
+        http_pool_size: int = 10,
+        http_retries: int = 3,
+        http_backoff_factor: float = 0.5,
     ):
+        """
+        http_pool_size is the number of keep-alive connections to the core service kept
+        open by the client. Idempotent requests failing with a connection error or one of
+        RETRY_STATUS_CODES are retried up to http_retries times, waiting a random time of
+        up to http_backoff_factor * 2 ** retry seconds, or as long as the Retry-After
+        header of the response asks, in between.
+        """
         logger = logging.getLogger()
 
         logger.setLevel(logging.WARNING)
@@ -78,6 +99,12 @@ class FeatureStoreClient():
         self._refresh_local_cache = refresh_local_cache
         self._aad_token = None
         self._aad_token_expire_on = datetime.utcnow()
+        # Requests sent concurrently, e.g. by apply_all, share one token refresh
+        self._aad_token_lock = threading.Lock()
+        self._http_pool_size = http_pool_size
+        self._http_retries = http_retries
+        self._http_backoff_factor = http_backoff_factor
+        self._http_session = None
 
         if self._aad_auth and self._aad_client_id == None:
             if "FEAST_CLIENT_ID" in os.environ:
@@ -120,18 +147,175 @@ class FeatureStoreClient():
 
     def _load_objects(
         self
-    ) -> Union[
-            Entity,
-            FeatureView,
-            FeatureService]:
+    ):
+        """
+        Syncs the objects of the project in the local cache with the ones of the core
+        service. The three collections are fetched and decoded concurrently, with the
+        ETag of the previous sync so that unchanged collections are not sent again, and
+        only objects whose proto changed since that sync are decoded. The changes are
+        written to the local registry in a single commit, and to the indexed snapshot
+        at snapshot_path.
+        """
+        registry = self.local._registry
+        registry_proto = registry._prepare_registry_for_changes()
+        sync_state = self._read_sync_state()
+        collections = [
+            ("entities", EntityV2Proto, registry_proto.entities),
+            ("featureviews", FeatureViewProto, registry_proto.feature_views),
+            ("featureservices", FeatureServiceProto, registry_proto.feature_services),
+        ]
+
+        with ThreadPoolExecutor(max_workers=len(collections)) as executor:
+            futures = [
+                executor.submit(
+                    self._sync_collection,
+                    collection,
+                    proto_class,
+                    sync_state.get(collection, {}),
+                    {proto.spec.name for proto in local_protos if proto.spec.project == self._project_name},
+                )
+                for collection, proto_class, local_protos in collections
+            ]
+
+            changed = False
+            for (collection, _, local_protos), future in zip(collections, futures):
+                result = future.result()
+                if result is None:
+                    continue
+                protos, collection_state = result
+                sync_state[collection] = collection_state
+                if all(proto is None for proto in protos.values()) and len(protos) == len(
+                    [proto for proto in local_protos if proto.spec.project == self._project_name]
+                ):
+                    continue
+
+                changed = True
+                for idx in reversed(range(len(local_protos))):
+                    name = local_protos[idx].spec.name
+                    if local_protos[idx].spec.project == self._project_name and protos.get(name, False) is not None:
+                        del local_protos[idx]
+                for proto in protos.values():
+                    if proto is not None:
+                        proto.spec.project = self._project_name
+                        local_protos.append(proto)
+
+        if changed:
+            registry.commit()
+        if changed or not os.path.exists(self.snapshot_path):
+            write_registry_snapshot(registry_proto, self.snapshot_path)
+        self._write_sync_state(sync_state)
+
+    def _sync_collection(
+        self, collection: str, proto_class, collection_state: dict, local_names: Set[str]
+    ) -> Optional[Tuple[Dict[str, Any], dict]]:
+        """
+        Fetches a collection unless its ETag matches the one of collection_state, and
+        returns None if it wasn't modified. Otherwise returns the objects of the
+        collection by name, with None for the objects that are unchanged in the local
+        cache, and the new state of the collection.
+        """
+        headers = self._get_request_header_internal()
+        if collection_state.get("etag"):
+            headers["If-None-Match"] = collection_state["etag"]
+        response = self._http.get(f"{self._uri}/api/projects/{self._project_name}/{collection}", headers=headers)
+        if response.status_code == 304:
+            return None
+        self._handle_error_response(response)
+
+        previous_digests = collection_state.get("objects", {})
+        digests = {}
+        protos = {}
+        for obj in response.json():
+            digest = hashlib.sha1(obj["proto"].encode('ascii')).hexdigest()
+            name = previous_digests.get(digest)
+            if name is None or name not in local_names:
+                proto = proto_class()
+                proto.ParseFromString(base64.b64decode(obj["proto"].encode('ascii')))
+                name = proto.spec.name
+                protos[name] = proto
+            else:
+                protos[name] = None
+            digests[digest] = name
+        return protos, {"etag": response.headers.get("ETag"), "objects": digests}
+
+    @property
+    def snapshot_path(self) -> str:
+        """
+        Path of the indexed snapshot of the local cache, rewritten whenever the cache is
+        written. Serving processes can read it with
+        feast_azure_provider.registry_snapshot.SnapshotRegistry
+        """
+        return f"{self._local_cache_file_path}.snapshot"
+
+    def _commit_local(
+        self
+    ):
+        """Writes the changes staged in the local cache, and its snapshot"""
+        self.local._registry.commit()
+        self._write_snapshot()
+
+    def _write_snapshot(
+        self
+    ):
+        write_registry_snapshot(
+            self.local._registry._get_registry_proto(allow_cache=True), self.snapshot_path
+        )
 
-        objects = []
-        objects = objects + self.list_entities()
-        objects = objects + self.list_feature_views()
-        objects = objects + self.list_feature_services()
+    @property
+    def _sync_state_path(self) -> str:
+        return f"{self._local_cache_file_path}.sync.json"
 
-        return objects
+    def _read_sync_state(
+        self
+    ) -> dict:
+        # The state describes the local cache, without the cache it is meaningless
+        if not os.path.exists(self._local_cache_file_path):
+            return {}
+        try:
+            with open(self._sync_state_path) as f:
+                sync_state = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if sync_state.get("project") != self._project_name:
+            return {}
+        return sync_state.get("collections", {})
+
+    def _write_sync_state(
+        self, sync_state: dict
+    ):
+        temp_path = f"{self._sync_state_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"project": self._project_name, "collections": sync_state}, f)
+        os.replace(temp_path, self._sync_state_path)
+
+    def _list_protos(
+        self, collection: str, proto_class
+    ) -> list:
+        response = self._http.get(f"{self._uri}/api/projects/{self._project_name}/{collection}", headers=self._get_request_header_internal())
+        self._handle_error_response(response)
+        protos = []
+        for obj in response.json():
+            proto = proto_class()
+            proto.ParseFromString(base64.b64decode(obj["proto"].encode('ascii')))
+            protos.append(proto)
+        return protos
     
+    @property
+    def _http(self):
+        if self._http_session == None:
+            self._http_session = _create_http_session(
+                self._http_pool_size, self._http_retries, self._http_backoff_factor
+            )
+        return self._http_session
+
+    def close(
+        self
+    ):
+        """Closes the connections to the core service"""
+        if self._http_session != None:
+            self._http_session.close()
+            self._http_session = None
+
     def _get_request_header_internal(
         self
     ) -> dict:
@@ -144,17 +328,22 @@ class FeatureStoreClient():
     def _get_aad_token_internal(
         self
     ) -> str:
-        if self._aad_token != None and self._aad_token_expire_on > datetime.utcnow():
-            return self._aad_token
-
+        with self._aad_token_lock:
+            if self._aad_token != None and self._aad_token_expire_on > datetime.utcnow():
+                return self._aad_token
+            return self._acquire_aad_token_internal()
 
+    def _acquire_aad_token_internal(
+        self
+    ) -> str:
         if "AZURE_CLIENT_ID" in os.environ and "AZURE_CLIENT_SECRET" in os.environ:
             
             spn_client_id = os.environ["AZURE_CLIENT_ID"]
             spn_client_secret = os.environ["AZURE_CLIENT_SECRET"]
             # Get token from service principal
             authority = f"https://login.microsoftonline.com/{self._aad_tenant_id}"
-            
+            import msal
+
             app = msal.ConfidentialClientApplication(
                 spn_client_id, client_credential=spn_client_secret, authority=authority
             )
@@ -170,6 +359,8 @@ class FeatureStoreClient():
         
             scope = f"api://{self._aad_client_id}/Feast.All"
             if self._default_credential == None:
+                from azure.identity import DeviceCodeCredential
+
                 self._default_credential = DeviceCodeCredential(
                     tenant_id=self._aad_tenant_id,
                     client_id=self._aad_client_id
@@ -204,8 +395,11 @@ class FeatureStoreClient():
 
     def _data_store_config_to_json(
         self,
-        config: Union[MsSqlServerOfflineStoreConfig, RedisOnlineStoreConfig]
+        config: Union["MsSqlServerOfflineStoreConfig", "RedisOnlineStoreConfig"]
     ) -> dict:
+        from feast_azure_provider.mssqlserver import MsSqlServerOfflineStoreConfig
+        from feast.infra.online_stores.redis import RedisOnlineStoreConfig
+
         if isinstance(config, MsSqlServerOfflineStoreConfig):
             return {
                 'type': SQL_OFFLINE_STORE_TYPE, 
@@ -243,7 +437,7 @@ class FeatureStoreClient():
         isDefault: bool = False
     ):
         content = self._repo_config_to_json(config, description, isDefault)
-        response = requests.put(f"{self._uri}/api/projects/{config.project}", 
+        response = self._http.put(f"{self._uri}/api/projects/{config.project}", 
             headers=self._get_request_header_internal(), json=content)
         self._handle_error_response(response)
 
@@ -254,7 +448,7 @@ class FeatureStoreClient():
         isDefault: bool = False
     ):
         content = self._repo_config_to_json(config, description, isDefault)
-        response = requests.patch(f"{self._uri}/api/projects/{config.project}", 
+        response = self._http.patch(f"{self._uri}/api/projects/{config.project}", 
             headers=self._get_request_header_internal(), json=content)
         self._handle_error_response(response)
         
@@ -262,7 +456,7 @@ class FeatureStoreClient():
         self,
         project_name: str
     ):
-        response = requests.delete(f"{self._uri}/api/projects/{project_name}", 
+        response = self._http.delete(f"{self._uri}/api/projects/{project_name}", 
             headers=self._get_request_header_internal())
         self._handle_error_response(response)
     
@@ -270,7 +464,7 @@ class FeatureStoreClient():
         self,
         project_name: str
     ) -> dict:
-        response = requests.get(f"{self._uri}/api/projects/{project_name}", 
+        response = self._http.get(f"{self._uri}/api/projects/{project_name}", 
             headers=self._get_request_header_internal())
         self._handle_error_response(response)
         project = response.json()
@@ -279,7 +473,7 @@ class FeatureStoreClient():
     def list_projects(
         self,
     ) -> dict:
-        response = requests.get(f"{self._uri}/api/projects", 
+        response = self._http.get(f"{self._uri}/api/projects", 
             headers=self._get_request_header_internal())
         self._handle_error_response(response)
         projects = response.json()
@@ -289,14 +483,11 @@ class FeatureStoreClient():
         self, entity: Entity, refresh_local_cache = True
     ):
         entity.is_valid()
-        proto_bytes = entity.to_proto().SerializeToString()
-        proto_base64_str = base64.b64encode(proto_bytes).decode('utf-8')
-        content = {'proto': proto_base64_str}
-        response = requests.post(f"{self._uri}/api/projects/{self._project_name}/entities/{entity.name}/apply", headers=self._get_request_header_internal(), json=content)
-        self._handle_error_response(response)
+        self._apply_remote(entity)
 
         if refresh_local_cache:
-            self.local._registry.apply_entity(entity, project=self._project_name)
+            self.local._registry.apply_entity(entity, project=self._project_name, commit=False)
+            self._commit_local()
            
     def create_entity(
         self, entity: Entity, refresh_local_cache = True
@@ -310,11 +501,12 @@ class FeatureStoreClient():
         proto_bytes = entity.to_proto().SerializeToString()
         proto_base64_str = base64.b64encode(proto_bytes).decode('utf-8')
         content = {'proto': proto_base64_str}
-        response = requests.put(f"{self._uri}/api/projects/{self._project_name}/entities/{entity.name}", headers=self._get_request_header_internal(), json=content)
+        response = self._http.put(f"{self._uri}/api/projects/{self._project_name}/entities/{entity.name}", headers=self._get_request_header_internal(), json=content)
         self._handle_error_response(response)
 
         if refresh_local_cache:
-            self.local._registry.apply_entity(entity, project=self._project_name)
+            self.local._registry.apply_entity(entity, project=self._project_name, commit=False)
+            self._commit_local()
             
     def update_entity(
         self, entity: Entity, refresh_local_cache = True
@@ -328,11 +520,12 @@ class FeatureStoreClient():
         proto_bytes = entity.to_proto().SerializeToString()
         proto_base64_str = base64.b64encode(proto_bytes).decode('utf-8')
         content = {'proto': proto_base64_str}
-        response = requests.patch(f"{self._uri}/api/projects/{self._project_name}/entities/{entity.name}", headers=self._get_request_header_internal(), json=content)
+        response = self._http.patch(f"{self._uri}/api/projects/{self._project_name}/entities/{entity.name}", headers=self._get_request_header_internal(), json=content)
         self._handle_error_response(response)
 
         if refresh_local_cache:
-            self.local._registry.apply_entity(entity, project=self._project_name)
+            self.local._registry.apply_entity(entity, project=self._project_name, commit=False)
+            self._commit_local()
     
     def _delete_entity_local(
         self, entity_name: str
@@ -348,7 +541,7 @@ class FeatureStoreClient():
                 and feature_service_proto.spec.project == self._project_name
             ):
                 del self.local._registry.cached_registry_proto.entities[idx]
-                self.local._registry.commit()
+                self._commit_local()
                 return
         raise EntityNotFoundException(entity_name, self._project_name)
 
@@ -359,7 +552,7 @@ class FeatureStoreClient():
         if entity_name == DUMMY_ENTITY_NAME:
             raise ValueError(f"Can not delete entity {DUMMY_ENTITY_NAME}")
         
-        response = requests.delete(f"{self._uri}/api/projects/{self._project_name}/entities/{entity_name}", headers=self._get_request_header_internal())
+        response = self._http.delete(f"{self._uri}/api/projects/{self._project_name}/entities/{entity_name}", headers=self._get_request_header_internal())
         self._handle_error_response(response)
         
         if refresh_local_cache:
@@ -368,7 +561,7 @@ class FeatureStoreClient():
     def get_entity(
         self, entity_name: str, refresh_local_cache = True
     ) -> Entity:
-        response = requests.get(f"{self._uri}/api/projects/{self._project_name}/entities/{entity_name}", headers=self._get_request_header_internal())
+        response = self._http.get(f"{self._uri}/api/projects/{self._project_name}/entities/{entity_name}", headers=self._get_request_header_internal())
         self._handle_error_response(response)
         
         entityResponse = response.json()
@@ -376,7 +569,8 @@ class FeatureStoreClient():
         entity_proto.ParseFromString(base64.b64decode(entityResponse["proto"].encode('ascii')))
         entity = Entity.from_proto(entity_proto)
         if refresh_local_cache:
-            self.local._registry.apply_entity(entity, project=self._project_name)
+            self.local._registry.apply_entity(entity, project=self._project_name, commit=False)
+            self._commit_local()
 
         return entity
     
@@ -384,31 +578,24 @@ class FeatureStoreClient():
         self, refresh_local_cache = True
     ) -> List[Entity]:
 
-        response = requests.get(f"{self._uri}/api/projects/{self._project_name}/entities", headers=self._get_request_header_internal())
-        self._handle_error_response(response)
-        entitie_response = response.json()
-        entities = []
-        for entity in entitie_response:
-            entity_proto = EntityV2Proto()
-            entity_proto.ParseFromString(base64.b64decode(entity["proto"].encode('ascii')))
-            entities.append(Entity.from_proto(entity_proto))
-        
+        entities = [
+            Entity.from_proto(entity_proto)
+            for entity_proto in self._list_protos("entities", EntityV2Proto)
+        ]
         if refresh_local_cache:
             self.local.apply(entities)
+            self._write_snapshot()
         return entities
 
     def apply_feature_view(
         self, feature_view: FeatureView, refresh_local_cache = True
     ):
         feature_view.is_valid()
-        proto_bytes = feature_view.to_proto().SerializeToString()
-        proto_base64_str = base64.b64encode(proto_bytes).decode('utf-8')
-        content = {'proto': proto_base64_str}
-        response = requests.post(f"{self._uri}/api/projects/{self._project_name}/featureviews/{feature_view.name}/apply", headers=self._get_request_header_internal(), json=content)
-        self._handle_error_response(response)
+        self._apply_remote(feature_view)
 
         if refresh_local_cache:
-            self.local._registry.apply_feature_view(feature_view, project=self._project_name)
+            self.local._registry.apply_feature_view(feature_view, project=self._project_name, commit=False)
+            self._commit_local()
         
     def create_feature_view(
         self, feature_view: FeatureView, refresh_local_cache = True
@@ -417,11 +604,12 @@ class FeatureStoreClient():
         proto_bytes = feature_view.to_proto().SerializeToString()
         proto_base64_str = base64.b64encode(proto_bytes).decode('utf-8')
         content = {'proto': proto_base64_str}
-        response = requests.put(f"{self._uri}/api/projects/{self._project_name}/featureviews/{feature_view.name}", headers=self._get_request_header_internal(), json=content)
+        response = self._http.put(f"{self._uri}/api/projects/{self._project_name}/featureviews/{feature_view.name}", headers=self._get_request_header_internal(), json=content)
         self._handle_error_response(response)
 
         if refresh_local_cache:
-            self.local._registry.apply_feature_view(feature_view, project=self._project_name)
+            self.local._registry.apply_feature_view(feature_view, project=self._project_name, commit=False)
+            self._commit_local()
             
     def update_feature_view(
         self, feature_view: FeatureView, refresh_local_cache = True
@@ -430,25 +618,27 @@ class FeatureStoreClient():
         proto_bytes = feature_view.to_proto().SerializeToString()
         proto_base64_str = base64.b64encode(proto_bytes).decode('utf-8')
         content = {'proto': proto_base64_str}
-        response = requests.patch(f"{self._uri}/api/projects/{self._project_name}/featureviews/{feature_view.name}", headers=self._get_request_header_internal(), json=content)
+        response = self._http.patch(f"{self._uri}/api/projects/{self._project_name}/featureviews/{feature_view.name}", headers=self._get_request_header_internal(), json=content)
         self._handle_error_response(response)
 
         if refresh_local_cache:
-            self.local._registry.apply_feature_view(feature_view, project=self._project_name)
+            self.local._registry.apply_feature_view(feature_view, project=self._project_name, commit=False)
+            self._commit_local()
     
     def delete_feature_view(
         self, feature_view_name: str, refresh_local_cache = True
     ):
-        response = requests.delete(f"{self._uri}/api/projects/{self._project_name}/featureviews/{feature_view_name}", headers=self._get_request_header_internal())
+        response = self._http.delete(f"{self._uri}/api/projects/{self._project_name}/featureviews/{feature_view_name}", headers=self._get_request_header_internal())
         self._handle_error_response(response)
         
         if refresh_local_cache:
-            self.local._registry.delete_feature_view(feature_view_name, project=self._project_name)
+            self.local._registry.delete_feature_view(feature_view_name, project=self._project_name, commit=False)
+            self._commit_local()
 
     def get_feature_view(
         self, feature_view_name: str, refresh_local_cache = True
     ) -> FeatureView:
-        response = requests.get(f"{self._uri}/api/projects/{self._project_name}/featureviews/{feature_view_name}", headers=self._get_request_header_internal())
+        response = self._http.get(f"{self._uri}/api/projects/{self._project_name}/featureviews/{feature_view_name}", headers=self._get_request_header_internal())
         self._handle_error_response(response)
         
         feature_viewResponse = response.json()
@@ -456,7 +646,8 @@ class FeatureStoreClient():
         feature_view_proto.ParseFromString(base64.b64decode(feature_viewResponse["proto"].encode('ascii')))
         feature_view = FeatureView.from_proto(feature_view_proto)
         if refresh_local_cache:
-            self.local._registry.apply_feature_view(feature_view, project=self._project_name)
+            self.local._registry.apply_feature_view(feature_view, project=self._project_name, commit=False)
+            self._commit_local()
 
         return feature_view
     
@@ -464,30 +655,23 @@ class FeatureStoreClient():
         self, refresh_local_cache = True
     ) -> List[FeatureView]:
 
-        response = requests.get(f"{self._uri}/api/projects/{self._project_name}/featureviews", headers=self._get_request_header_internal())
-        self._handle_error_response(response)
-        entitie_response = response.json()
-        featureviews = []
-        for feature_view in entitie_response:
-            feature_view_proto = FeatureViewProto()
-            feature_view_proto.ParseFromString(base64.b64decode(feature_view["proto"].encode('ascii')))
-            featureviews.append(FeatureView.from_proto(feature_view_proto))
-        
+        featureviews = [
+            FeatureView.from_proto(feature_view_proto)
+            for feature_view_proto in self._list_protos("featureviews", FeatureViewProto)
+        ]
         if refresh_local_cache:
             self.local.apply(featureviews)
+            self._write_snapshot()
         return featureviews
 
     def apply_feature_service(
         self, feature_service: FeatureService, refresh_local_cache = True
     ):
-        proto_bytes = feature_service.to_proto().SerializeToString()
-        proto_base64_str = base64.b64encode(proto_bytes).decode('utf-8')
-        content = {'proto': proto_base64_str}
-        response = requests.post(f"{self._uri}/api/projects/{self._project_name}/featureservices/{feature_service.name}/apply", headers=self._get_request_header_internal(), json=content)
-        self._handle_error_response(response)
+        self._apply_remote(feature_service)
 
         if refresh_local_cache:
-            self.local._registry.apply_feature_service(feature_service, project=self._project_name)
+            self.local._registry.apply_feature_service(feature_service, project=self._project_name, commit=False)
+            self._commit_local()
            
 
     def create_feature_service(
@@ -496,11 +680,12 @@ class FeatureStoreClient():
         proto_bytes = feature_service.to_proto().SerializeToString()
         proto_base64_str = base64.b64encode(proto_bytes).decode('utf-8')
         content = {'proto': proto_base64_str}
-        response = requests.put(f"{self._uri}/api/projects/{self._project_name}/featureservices/{feature_service.name}", headers=self._get_request_header_internal(), json=content)
+        response = self._http.put(f"{self._uri}/api/projects/{self._project_name}/featureservices/{feature_service.name}", headers=self._get_request_header_internal(), json=content)
         self._handle_error_response(response)
 
         if refresh_local_cache:
-            self.local._registry.apply_feature_service(feature_service, project=self._project_name)
+            self.local._registry.apply_feature_service(feature_service, project=self._project_name, commit=False)
+            self._commit_local()
             
     def update_feature_service(
         self, feature_service: FeatureService, refresh_local_cache = True
@@ -508,25 +693,27 @@ class FeatureStoreClient():
         proto_bytes = feature_service.to_proto().SerializeToString()
         proto_base64_str = base64.b64encode(proto_bytes).decode('utf-8')
         content = {'proto': proto_base64_str}
-        response = requests.patch(f"{self._uri}/api/projects/{self._project_name}/featureservices/{feature_service.name}", headers=self._get_request_header_internal(), json=content)
+        response = self._http.patch(f"{self._uri}/api/projects/{self._project_name}/featureservices/{feature_service.name}", headers=self._get_request_header_internal(), json=content)
         self._handle_error_response(response)
 
         if refresh_local_cache:
-            self.local._registry.apply_feature_service(feature_service, project=self._project_name)
+            self.local._registry.apply_feature_service(feature_service, project=self._project_name, commit=False)
+            self._commit_local()
     
     def delete_feature_service(
         self, feature_service_name: str, refresh_local_cache = True
     ):
-        response = requests.delete(f"{self._uri}/api/projects/{self._project_name}/featureservices/{feature_service_name}", headers=self._get_request_header_internal())
+        response = self._http.delete(f"{self._uri}/api/projects/{self._project_name}/featureservices/{feature_service_name}", headers=self._get_request_header_internal())
         self._handle_error_response(response)
         
         if refresh_local_cache:
-            self.local._registry.delete_feature_service(feature_service_name, project=self._project_name)
+            self.local._registry.delete_feature_service(feature_service_name, project=self._project_name, commit=False)
+            self._commit_local()
 
     def get_feature_service(
         self, feature_service_name: str, refresh_local_cache = True
     ) -> FeatureService:
-        response = requests.get(f"{self._uri}/api/projects/{self._project_name}/featureservices/{feature_service_name}", headers=self._get_request_header_internal())
+        response = self._http.get(f"{self._uri}/api/projects/{self._project_name}/featureservices/{feature_service_name}", headers=self._get_request_header_internal())
         self._handle_error_response(response)
         
         feature_serviceResponse = response.json()
@@ -534,7 +721,8 @@ class FeatureStoreClient():
         feature_service_proto.ParseFromString(base64.b64decode(feature_serviceResponse["proto"].encode('ascii')))
         feature_service = FeatureService.from_proto(feature_service_proto)
         if refresh_local_cache:
-            self.local._registry.apply_feature_service(feature_service, project=self._project_name)
+            self.local._registry.apply_feature_service(feature_service, project=self._project_name, commit=False)
+            self._commit_local()
 
         return feature_service
     
@@ -542,36 +730,124 @@ class FeatureStoreClient():
         self, refresh_local_cache = True
     ) -> List[FeatureService]:
 
-        response = requests.get(f"{self._uri}/api/projects/{self._project_name}/featureservices", headers=self._get_request_header_internal())
-        self._handle_error_response(response)
-        entitie_response = response.json()
-        featureservices = []
-        for feature_service in entitie_response:
-            feature_service_proto = FeatureServiceProto()
-            feature_service_proto.ParseFromString(base64.b64decode(feature_service["proto"].encode('ascii')))
-            featureservices.append(FeatureService.from_proto(feature_service_proto))
-        
+        featureservices = [
+            FeatureService.from_proto(feature_service_proto)
+            for feature_service_proto in self._list_protos("featureservices", FeatureServiceProto)
+        ]
         if refresh_local_cache:
             self.local.apply(featureservices)
+            self._write_snapshot()
         return featureservices
 
+    def _apply_remote(
+        self, obj: Union[FeatureView, Entity, FeatureService]
+    ):
+        if isinstance(obj, Entity):
+            collection = "entities"
+        elif isinstance(obj, FeatureView):
+            collection = "featureviews"
+        else:
+            collection = "featureservices"
+        proto_bytes = obj.to_proto().SerializeToString()
+        proto_base64_str = base64.b64encode(proto_bytes).decode('utf-8')
+        content = {'proto': proto_base64_str}
+        response = self._http.post(f"{self._uri}/api/projects/{self._project_name}/{collection}/{obj.name}/apply", headers=self._get_request_header_internal(), json=content)
+        self._handle_error_response(response)
+
+    def _apply_local(
+        self, obj: Union[FeatureView, Entity, FeatureService]
+    ):
+        # Staged in the cached registry proto, written by the caller's commit()
+        if isinstance(obj, Entity):
+            self.local._registry.apply_entity(obj, project=self._project_name, commit=False)
+        elif isinstance(obj, FeatureView):
+            self.local._registry.apply_feature_view(obj, project=self._project_name, commit=False)
+        else:
+            self.local._registry.apply_feature_service(obj, project=self._project_name, commit=False)
+
     def apply_all(
-        self, objects: List[Union[FeatureView, Entity, FeatureService]], refresh_local_cache: bool = True
+        self, objects: List[Union[FeatureView, Entity, FeatureService]], refresh_local_cache: bool = True,
+        max_parallel_requests: int = DEFAULT_APPLY_PARALLELISM
     ):
+        """
+        Applies the objects to the core service, up to max_parallel_requests at a time.
+        Entities are applied before the feature views referencing them, and feature views
+        before feature services. The local cache is written once at the end, with the
+        objects that were applied if a request failed. The first error is raised once
+        all requests were answered and the local cache was written.
+        """
         # DUMMY_ENTITY is a placeholder entity used in entityless FeatureViews
         DUMMY_ENTITY = Entity(
             name=DUMMY_ENTITY_NAME,
             join_key=DUMMY_ENTITY_ID,
             value_type=ValueType.INT32,
         )
-        self.apply_entity(DUMMY_ENTITY, refresh_local_cache)
-
+        entities = [DUMMY_ENTITY]
+        feature_views = []
+        feature_services = []
         for obj in objects:
             if isinstance(obj, Entity):
-                self.apply_entity(obj, refresh_local_cache)
+                obj.is_valid()
+                entities.append(obj)
             elif isinstance(obj, FeatureView):
-                self.apply_feature_view(obj, refresh_local_cache)
+                obj.is_valid()
+                feature_views.append(obj)
             elif isinstance(obj, FeatureService):
-                self.apply_feature_service(obj, refresh_local_cache)
+                feature_services.append(obj)
             else:
-                raise ValueError("Unknown object type provided.")
\ No newline at end of file
+                raise ValueError("Unknown object type provided.")
+
+        staged = False
+        error = None
+        with ThreadPoolExecutor(max_workers=max_parallel_requests) as executor:
+            for batch in [entities, feature_views, feature_services]:
+                futures = {executor.submit(self._apply_remote, obj): obj for obj in batch}
+                # Every request of the batch is waited for, so that the objects that
+                # were applied are in the local cache even if another request failed
+                for future in as_completed(futures):
+                    if future.exception() is not None:
+                        error = error or future.exception()
+                    elif refresh_local_cache:
+                        self._apply_local(futures[future])
+                        staged = True
+                # The next batches may reference the objects that failed
+                if error is not None:
+                    break
+
+        if staged:
+            self._commit_local()
+        if error is not None:
+            raise error
+
+def _create_http_session(
+    pool_size: int, retries: int, backoff_factor: float
+):
+    """
+    Creates a requests.Session keeping up to pool_size connections alive and retrying
+    failed requests with jittered exponential backoff. Responses are gzip compressed
+    when the server supports it, as requests accepts gzip by default.
+    """
+    import random
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    class _JitteredRetry(Retry):
+        # Spreads the retries of concurrent requests instead of retrying them in lockstep
+        def get_backoff_time(self):
+            return random.uniform(0, super().get_backoff_time())
+
+    retry = _JitteredRetry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUS_CODES,
+        raise_on_status=False,
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
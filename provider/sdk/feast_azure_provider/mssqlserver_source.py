@@ -1,18 +1,44 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT license.
 
-from typing import Callable, Dict, Iterable, Optional, Tuple
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
 import json
+import threading
+import time
 
 import pandas
-from sqlalchemy import create_engine
 
 from feast import type_map
 from feast.data_source import DataSource
+from feast.errors import DataSourceNotFoundException
 from feast.protos.feast.core.DataSource_pb2 import DataSource as DataSourceProto
 from feast.value_type import ValueType
 from feast.repo_config import RepoConfig
 
+# Seconds the column names and types of a table are used without checking if the
+# table was altered. Tables are then only fetched again if their modify_date changed.
+SCHEMA_CACHE_TTL_SECONDS = 300
+
+
+class _TableSchema(NamedTuple):
+    # modify_date of the table, which changes whenever its columns are altered
+    version: str
+    columns: List[Tuple[str, str]]
+    fetched_at: float
+
+
+# Tables referenced by the MsSqlServerSources created in this process, per connection
+# string and database. When the schema of one of them is needed the schemas of all of
+# them are fetched with a single query.
+_referenced_tables: Dict[Tuple[str, str], Set[Tuple[Optional[str], str]]] = {}
+
+# Cached schemas per connection string, database, schema and table
+_schema_cache: Dict[Tuple[str, str, Optional[str], str], _TableSchema] = {}
+
+# Cached result set schemas of query sources per connection string and query
+_query_schema_cache: Dict[Tuple[str, str], _TableSchema] = {}
+_schema_lock = threading.Lock()
+
 
 class MsSqlServerOptions:
     """
@@ -20,10 +46,16 @@ class MsSqlServerOptions:
     """
 
     def __init__(
-        self, connection_str: Optional[str], table_ref: Optional[str],
+        self,
+        connection_str: Optional[str],
+        table_ref: Optional[str],
+        watermark_column: Optional[str] = None,
+        query: Optional[str] = None,
     ):
         self._connection_str = connection_str
         self._table_ref = table_ref
+        self._watermark_column = watermark_column
+        self._query = query
 
     @property
     def table_ref(self):
@@ -39,6 +71,35 @@ class MsSqlServerOptions:
         """
         self._table_ref = table_ref
 
+    @property
+    def query(self):
+        """
+        Returns the SQL query of this SQL Server source
+        """
+        return self._query
+
+    @query.setter
+    def query(self, query):
+        """
+        Sets the SQL query of this SQL Server source
+        """
+        self._query = query
+
+    @property
+    def watermark_column(self):
+        """
+        Returns the column used to track incremental materialization of this source,
+        an integer, date/time or rowversion column
+        """
+        return self._watermark_column
+
+    @watermark_column.setter
+    def watermark_column(self, watermark_column):
+        """
+        Sets the column used to track incremental materialization of this source
+        """
+        self._watermark_column = watermark_column
+
     @property
     def connection_str(self):
         """
@@ -67,7 +128,10 @@ class MsSqlServerOptions:
         options = json.loads(sqlserver_options_proto.configuration)
 
         sqlserver_options = cls(
-            table_ref=options["table_ref"], connection_str=options["connection_str"],
+            table_ref=options["table_ref"],
+            connection_str=options["connection_str"],
+            watermark_column=options.get("watermark_column"),
+            query=options.get("query"),
         )
 
         return sqlserver_options
@@ -84,6 +148,8 @@ class MsSqlServerOptions:
                 {
                     "table_ref": self._table_ref,
                     "connection_string": self._connection_str,
+                    "watermark_column": self._watermark_column,
+                    "query": self._query,
                 }
             ).encode("utf-8")
         )
@@ -92,6 +158,16 @@ class MsSqlServerOptions:
 
 
 class MsSqlServerSource(DataSource):
+    """
+    Source of feature data in SQL Server, either a table or view referenced by
+    table_ref, or the result of a SELECT query.
+
+    The offline store filters a source on its event timestamps, on the entity keys
+    being retrieved and, if date_partition_column is set, on that column, so that
+    SQL Server only reads the partitions of a partitioned table spanned by the
+    retrieval. date_partition_column must hold the UTC date of event_timestamp_column.
+    """
+
     def __init__(
         self,
         table_ref: Optional[str] = None,
@@ -100,11 +176,21 @@ class MsSqlServerSource(DataSource):
         field_mapping: Optional[Dict[str, str]] = None,
         date_partition_column: Optional[str] = "",
         connection_str: Optional[str] = "",
+        watermark_column: Optional[str] = None,
+        query: Optional[str] = None,
     ):
+        if table_ref and query:
+            raise ValueError(
+                "MsSqlServerSource takes either a table_ref or a query, not both"
+            )
         self._mssqlserver_options = MsSqlServerOptions(
-            connection_str=connection_str, table_ref=table_ref
+            connection_str=connection_str,
+            table_ref=table_ref,
+            watermark_column=watermark_column,
+            query=query,
         )
         self._connection_str = connection_str
+        _register_table_ref(connection_str, table_ref)
 
         super().__init__(
             event_timestamp_column
@@ -126,12 +212,23 @@ class MsSqlServerSource(DataSource):
             and self.event_timestamp_column == other.event_timestamp_column
             and self.created_timestamp_column == other.created_timestamp_column
             and self.field_mapping == other.field_mapping
+            and self.watermark_column == other.watermark_column
+            and self.table_ref == other.table_ref
+            and self.query == other.query
         )
 
     @property
     def table_ref(self):
         return self._mssqlserver_options.table_ref
 
+    @property
+    def query(self):
+        return self._mssqlserver_options.query
+
+    @property
+    def watermark_column(self):
+        return self._mssqlserver_options.watermark_column
+
     @property
     def mssqlserver_options(self):
         """
@@ -153,6 +250,8 @@ class MsSqlServerSource(DataSource):
             field_mapping=dict(data_source.field_mapping),
             table_ref=options["table_ref"],
             connection_str=options["connection_string"],
+            watermark_column=options.get("watermark_column"),
+            query=options.get("query"),
             event_timestamp_column=data_source.event_timestamp_column,
             created_timestamp_column=data_source.created_timestamp_column,
             date_partition_column=data_source.date_partition_column,
@@ -173,6 +272,8 @@ class MsSqlServerSource(DataSource):
 
     def get_table_query_string(self) -> str:
         """Returns a string that can directly be used to reference this table in SQL"""
+        if self.query:
+            return f"({self.query})"
         return f"`{self.table_ref}`"
 
     def validate(self, config: RepoConfig):
@@ -185,21 +286,174 @@ class MsSqlServerSource(DataSource):
     def source_datatype_to_feast_value_type() -> Callable[[str], ValueType]:
         return type_map.mssqlserver_to_feast_value_type
 
-    def get_table_column_names_and_types(self) -> Iterable[Tuple[str, str]]:
-        conn = create_engine(self._connection_str)
-        name_type_pairs = []
-        database, table_name = self.table_ref.split(".")
-        columns_query = f"""
-            SELECT COLUMN_NAME, DATA_TYPE FROM {database}.INFORMATION_SCHEMA.COLUMNS
-            WHERE TABLE_NAME = '{table_name}'
-        """
-        table_schema = pandas.read_sql(columns_query, conn)
-        name_type_pairs.extend(
-            list(
-                zip(
-                    table_schema["COLUMN_NAME"].to_list(),
-                    table_schema["DATA_TYPE"].to_list(),
-                )
-            )
+    def get_table_column_names_and_types(
+        self, config: RepoConfig = None
+    ) -> Iterable[Tuple[str, str]]:
+        if self.query:
+            return _get_query_column_names_and_types(self._connection_str, self.query)
+        database, schema, table_name = _split_table_ref(self.table_ref)
+        # Sources built from protos are not registered by their constructor
+        _register_table_ref(self._connection_str, self.table_ref)
+        key = (self._connection_str, database, schema, table_name)
+        with _schema_lock:
+            table_schema = _schema_cache.get(key)
+            if (
+                table_schema is not None
+                and time.monotonic() - table_schema.fetched_at > SCHEMA_CACHE_TTL_SECONDS
+            ):
+                if table_schema.version in _fetch_table_versions(
+                    self._connection_str, database, schema, table_name
+                ):
+                    table_schema = table_schema._replace(fetched_at=time.monotonic())
+                    _schema_cache[key] = table_schema
+                else:
+                    table_schema = None
+            if table_schema is None:
+                _fetch_table_schemas(self._connection_str, database)
+                table_schema = _schema_cache.get(key)
+        if table_schema is None:
+            raise DataSourceNotFoundException(self.table_ref)
+        return list(table_schema.columns)
+
+
+def clear_schema_cache():
+    """Forgets all cached table schemas, e.g. after tables were altered"""
+    with _schema_lock:
+        _schema_cache.clear()
+        _query_schema_cache.clear()
+
+
+def _split_table_ref(table_ref: str) -> Tuple[str, Optional[str], str]:
+    """
+    Splits "database.table" or "database.schema.table" into its parts, the schema of
+    "database.table" is None and matches any schema
+    """
+    parts = table_ref.split(".")
+    if len(parts) == 2:
+        return parts[0], None, parts[1]
+    database, schema, table_name = parts
+    return database, schema, table_name
+
+
+def _register_table_ref(connection_str: str, table_ref: Optional[str]):
+    if not table_ref:
+        return
+    try:
+        database, schema, table_name = _split_table_ref(table_ref)
+    except ValueError:
+        return
+    with _schema_lock:
+        _referenced_tables.setdefault((connection_str, database), set()).add(
+            (schema, table_name)
         )
-        return name_type_pairs
+
+
+def _fetch_table_schemas(connection_str: str, database: str):
+    """
+    Fetches the columns of every referenced table of a database in one
+    INFORMATION_SCHEMA query and caches them. Must be called holding _schema_lock.
+    """
+    # Imported here so that feature repos defining sources don't load SQLAlchemy
+    from .engine_registry import get_engine
+
+    tables = list(_referenced_tables.get((connection_str, database), set()))
+    if not tables:
+        return
+    table_filter = _table_filter(tables, "c.TABLE_SCHEMA", "c.TABLE_NAME")
+    columns_query = f"""
+        SELECT c.TABLE_SCHEMA, c.TABLE_NAME, c.COLUMN_NAME, c.DATA_TYPE,
+            CONVERT(VARCHAR(27), o.modify_date, 121) AS SCHEMA_VERSION
+        FROM {database}.INFORMATION_SCHEMA.COLUMNS c
+        JOIN {database}.sys.objects o
+            ON o.object_id = OBJECT_ID(QUOTENAME('{database}') + '.' + QUOTENAME(c.TABLE_SCHEMA) + '.' + QUOTENAME(c.TABLE_NAME))
+        WHERE {table_filter}
+        ORDER BY c.TABLE_SCHEMA, c.TABLE_NAME, c.ORDINAL_POSITION
+    """
+    table_schemas = pandas.read_sql(columns_query, get_engine(connection_str))
+
+    # Tables that were dropped are not in the result
+    for schema, table_name in tables:
+        _schema_cache.pop((connection_str, database, schema, table_name), None)
+    fetched_at = time.monotonic()
+    for (schema, table_name), columns in table_schemas.groupby(
+        ["TABLE_SCHEMA", "TABLE_NAME"], sort=False
+    ):
+        table_schema = _TableSchema(
+            version=columns["SCHEMA_VERSION"].iloc[0],
+            columns=list(
+                zip(columns["COLUMN_NAME"].to_list(), columns["DATA_TYPE"].to_list())
+            ),
+            fetched_at=fetched_at,
+        )
+        _schema_cache[(connection_str, database, schema, table_name)] = table_schema
+        if (None, table_name) in tables:
+            _schema_cache[(connection_str, database, None, table_name)] = table_schema
+
+
+def _fetch_table_versions(
+    connection_str: str, database: str, schema: Optional[str], table_name: str
+) -> Set[str]:
+    """
+    Returns the modify_date of the tables matching a table reference, which is much
+    cheaper to query than their columns
+    """
+    from .engine_registry import get_engine
+
+    table_filter = _table_filter([(schema, table_name)], "s.name", "o.name")
+    versions_query = f"""
+        SELECT CONVERT(VARCHAR(27), o.modify_date, 121) AS SCHEMA_VERSION
+        FROM {database}.sys.objects o
+        JOIN {database}.sys.schemas s ON s.schema_id = o.schema_id
+        WHERE {table_filter}
+    """
+    versions = pandas.read_sql(versions_query, get_engine(connection_str))
+    return set(versions["SCHEMA_VERSION"].to_list())
+
+
+def _table_filter(
+    tables: List[Tuple[Optional[str], str]], schema_column: str, name_column: str
+) -> str:
+    return " OR ".join(
+        f"({name_column} = '{table_name}')"
+        if schema is None
+        else f"({schema_column} = '{schema}' AND {name_column} = '{table_name}')"
+        for schema, table_name in tables
+    )
+
+
+def _get_query_column_names_and_types(
+    connection_str: str, query: str
+) -> List[Tuple[str, str]]:
+    """
+    Returns the columns of the result set of a query, described by SQL Server
+    without running the query
+    """
+    # Imported here so that feature repos defining sources don't load SQLAlchemy
+    from sqlalchemy import text
+
+    from .engine_registry import get_engine
+
+    key = (connection_str, query)
+    with _schema_lock:
+        query_schema = _query_schema_cache.get(key)
+        if (
+            query_schema is None
+            or time.monotonic() - query_schema.fetched_at > SCHEMA_CACHE_TTL_SECONDS
+        ):
+            with get_engine(connection_str).connect() as conn:
+                rows = conn.execute(
+                    text(
+                        "SELECT name, system_type_name "
+                        "FROM sys.dm_exec_describe_first_result_set(:query, NULL, 0) "
+                        "ORDER BY column_ordinal"
+                    ),
+                    {"query": query},
+                ).fetchall()
+            query_schema = _TableSchema(
+                version="",
+                # system_type_name includes the length, e.g. nvarchar(50)
+                columns=[(name, type_name.split("(")[0]) for name, type_name in rows],
+                fetched_at=time.monotonic(),
+            )
+            _query_schema_cache[key] = query_schema
+    return list(query_schema.columns)
@@ -0,0 +1,132 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from feast.protos.feast.types.Value_pb2 import Value as ValueProto
+
+# Rough per-entry cost of the Python objects holding a cached row, on top of the
+# serialized size of its key and values
+_ENTRY_OVERHEAD_BYTES = 200
+
+OnlineRow = Tuple[Optional[datetime], Optional[Dict[str, ValueProto]]]
+
+
+class _CacheEntry(NamedTuple):
+    expires_at: float
+    timestamp: Optional[datetime]
+    values: Dict[str, ValueProto]
+    size: int
+
+
+class OnlineFeatureCache:
+    """
+    Thread-safe LRU cache of online store rows keyed by (feature view, entity key).
+
+    The cache is bounded by an estimate of the memory its entries use, and the least
+    recently used entries are evicted once it grows past max_bytes. Every entry expires
+    after the ttl it was stored with.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Tuple[str, bytes], _CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(
+        self, feature_view_name: str, entity_key: bytes, requested_features: List[str]
+    ) -> Optional[OnlineRow]:
+        """Returns the cached row with the requested features, or None on a miss"""
+        key = (feature_view_name, entity_key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None or any(
+                feature_name not in entry.values for feature_name in requested_features
+            ):
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return (
+                entry.timestamp,
+                {
+                    feature_name: entry.values[feature_name]
+                    for feature_name in requested_features
+                },
+            )
+
+    def put(
+        self,
+        feature_view_name: str,
+        entity_key: bytes,
+        row: OnlineRow,
+        ttl: timedelta,
+    ) -> None:
+        timestamp, values = row
+        if values is None:
+            return
+
+        key = (feature_view_name, entity_key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                # Features read by an earlier request for the same row are kept
+                if entry.timestamp == timestamp:
+                    values = {**entry.values, **values}
+                self._remove(key)
+
+            size = (
+                _ENTRY_OVERHEAD_BYTES
+                + len(entity_key)
+                + sum(len(name) + value.ByteSize() for name, value in values.items())
+            )
+            if size > self.max_bytes:
+                return
+            self._entries[key] = _CacheEntry(
+                time.monotonic() + ttl.total_seconds(), timestamp, values, size
+            )
+            self.size += size
+
+            while self.size > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def invalidate(self, feature_view_name: str) -> None:
+        """Drops all cached rows of a feature view"""
+        with self._lock:
+            keys = [key for key in self._entries if key[0] == feature_view_name]
+            for key in keys:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the hit, miss and eviction counters and the current size of the cache"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "size": self.size,
+            }
+
+    def _remove(self, key: Tuple[str, bytes]) -> None:
+        entry = self._entries.pop(key)
+        self.size -= entry.size
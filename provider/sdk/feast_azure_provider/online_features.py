@@ -0,0 +1,136 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import asyncio
+from typing import Any, Dict, List, Union
+
+from feast.errors import (
+    EntityNotFoundException,
+    RequestDataNotFoundInEntityRowsException,
+)
+from feast.feature_service import FeatureService
+from feast.feature_store import (
+    FeatureStore,
+    _entity_row_to_field_values,
+    _entity_row_to_key,
+    _get_table_entity_keys,
+    _group_feature_refs,
+    _validate_feature_refs,
+)
+from feast.feature_view import DUMMY_ENTITY_ID, DUMMY_ENTITY_NAME, DUMMY_ENTITY_VAL
+from feast.online_response import OnlineResponse, _infer_online_entity_rows
+from feast.protos.feast.serving.ServingService_pb2 import GetOnlineFeaturesResponse
+from feast.type_map import python_value_to_proto_value
+
+
+async def get_online_features_async(
+    store: FeatureStore,
+    features: Union[List[str], FeatureService],
+    entity_rows: List[Dict[str, Any]],
+    full_feature_names: bool = False,
+) -> OnlineResponse:
+    """
+    Asynchronous counterpart of FeatureStore.get_online_features for stores using the
+    AzureProvider. The feature views are read concurrently with
+    AzureProvider.online_read_async, so the event loop is never blocked on the online
+    store.
+    """
+    _feature_refs = store._get_features(features, None)
+    all_feature_views = store._list_feature_views(
+        allow_cache=True, hide_dummy_entity=False
+    )
+    all_on_demand_feature_views = store._registry.list_on_demand_feature_views(
+        project=store.project, allow_cache=True
+    )
+
+    _validate_feature_refs(_feature_refs, full_feature_names)
+    grouped_refs, grouped_odfv_refs = _group_feature_refs(
+        _feature_refs, all_feature_views, all_on_demand_feature_views
+    )
+    entityless_case = DUMMY_ENTITY_NAME in [
+        entity_name
+        for feature_view, _ in grouped_refs
+        for entity_name in feature_view.entities
+    ]
+
+    provider = store._get_provider()
+    entities = store._list_entities(allow_cache=True, hide_dummy_entity=False)
+    entity_name_to_join_key_map = {entity.name: entity.join_key for entity in entities}
+    needed_request_data_features = store._get_needed_request_data_features(
+        grouped_odfv_refs
+    )
+
+    join_key_rows = []
+    request_data_features: Dict[str, List[Any]] = {}
+    # Entity rows may be either entities or request data.
+    for row in entity_rows:
+        join_key_row = {}
+        for entity_name, entity_value in row.items():
+            if entity_name in needed_request_data_features:
+                request_data_features.setdefault(entity_name, []).append(entity_value)
+                continue
+            try:
+                join_key = entity_name_to_join_key_map[entity_name]
+            except KeyError:
+                raise EntityNotFoundException(entity_name, store.project)
+            join_key_row[join_key] = entity_value
+            if entityless_case:
+                join_key_row[DUMMY_ENTITY_ID] = DUMMY_ENTITY_VAL
+        if len(join_key_row) > 0:
+            join_key_rows.append(join_key_row)
+
+    if len(needed_request_data_features) != len(request_data_features.keys()):
+        raise RequestDataNotFoundInEntityRowsException(
+            feature_names=needed_request_data_features
+        )
+
+    entity_row_proto_list = _infer_online_entity_rows(join_key_rows)
+    union_of_entity_keys = [_entity_row_to_key(row) for row in entity_row_proto_list]
+    result_rows = [_entity_row_to_field_values(row) for row in entity_row_proto_list]
+
+    for feature_name, feature_values in request_data_features.items():
+        for result_row, feature_value in zip(result_rows, feature_values):
+            result_row.fields[feature_name].CopyFrom(
+                python_value_to_proto_value(feature_value)
+            )
+            result_row.statuses[
+                feature_name
+            ] = GetOnlineFeaturesResponse.FieldStatus.PRESENT
+
+    read_rows_per_view = await asyncio.gather(
+        *(
+            provider.online_read_async(
+                config=store.config,
+                table=table,
+                entity_keys=_get_table_entity_keys(
+                    table, union_of_entity_keys, entity_name_to_join_key_map
+                ),
+                requested_features=requested_features,
+            )
+            for table, requested_features in grouped_refs
+        )
+    )
+    for (table, requested_features), read_rows in zip(grouped_refs, read_rows_per_view):
+        for result_row, (_, feature_data) in zip(result_rows, read_rows):
+            for feature_name in requested_features:
+                feature_ref = (
+                    f"{table.name}__{feature_name}"
+                    if full_feature_names
+                    else feature_name
+                )
+                if feature_data is None:
+                    result_row.statuses[
+                        feature_ref
+                    ] = GetOnlineFeaturesResponse.FieldStatus.NOT_FOUND
+                elif feature_name in feature_data:
+                    result_row.fields[feature_ref].CopyFrom(feature_data[feature_name])
+                    result_row.statuses[
+                        feature_ref
+                    ] = GetOnlineFeaturesResponse.FieldStatus.PRESENT
+
+    initial_response = OnlineResponse(
+        GetOnlineFeaturesResponse(field_values=result_rows)
+    )
+    return store._augment_response_with_on_demand_transforms(
+        _feature_refs, full_feature_names, initial_response, result_rows
+    )
@@ -0,0 +1,351 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import struct
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pyarrow
+
+from feast.feature_view import FeatureView
+from feast.infra.online_stores.helpers import _mmh3
+from feast.protos.feast.types.EntityKey_pb2 import EntityKey as EntityKeyProto
+from feast.protos.feast.types.Value_pb2 import Value as ValueProto
+from feast.protos.feast.types.Value_pb2 import ValueType
+from feast.type_map import python_value_to_proto_value
+
+# Columnar counterparts of feast's _convert_arrow_to_proto and of the serialization done
+# by the Redis online store. Values are converted a column at a time based on the Arrow
+# type of the column instead of inspecting the Python type of every value, and
+# fixed-width values are encoded with numpy straight from the column buffers.
+# The output is byte-for-byte identical to the row-by-row implementations.
+
+# Protobuf tags (field number << 3 | wire type) of the ValueProto fields we encode
+_BYTES_VAL_TAG = 0x0A
+_STRING_VAL_TAG = 0x12
+_INT64_VAL_TAG = 0x20
+_DOUBLE_VAL_TAG = 0x29
+_BOOL_VAL_TAG = 0x38
+# Tag of google.protobuf.Timestamp.seconds
+_TIMESTAMP_SECONDS_TAG = 0x08
+
+_BOOL_VAL_BYTES = {
+    True: bytes([_BOOL_VAL_TAG, 1]),
+    False: bytes([_BOOL_VAL_TAG, 0]),
+}
+
+# Same value as feast.infra.online_stores.redis.EX_SECONDS
+_EX_SECONDS = 253402300799
+
+# Number of HSETs sent to Redis per pipelined round trip
+DEFAULT_REDIS_PIPELINE_SIZE = 1000
+
+RedisRow = Tuple[bytes, Dict[bytes, bytes]]
+
+
+def convert_arrow_to_proto(
+    table: pyarrow.Table, feature_view: FeatureView, join_keys: List[str],
+) -> List[Tuple[EntityKeyProto, Dict[str, ValueProto], datetime, Optional[datetime]]]:
+    """
+    Drop-in replacement for feast.infra.provider._convert_arrow_to_proto that converts
+    the table column by column.
+    """
+    entity_key_columns = [
+        _column_to_proto_values(table.column(join_key)) for join_key in join_keys
+    ]
+    feature_names = [feature.name for feature in feature_view.features]
+    feature_columns = [
+        _column_to_proto_values(table.column(name)) for name in feature_names
+    ]
+    event_timestamps = _column_to_datetimes(
+        table.column(feature_view.batch_source.event_timestamp_column)
+    )
+    if feature_view.batch_source.created_timestamp_column:
+        created_timestamps = _column_to_datetimes(
+            table.column(feature_view.batch_source.created_timestamp_column)
+        )
+    else:
+        created_timestamps = [None] * table.num_rows
+
+    rows_to_write = []
+    for entity_values, feature_values, event_timestamp, created_timestamp in zip(
+        zip(*entity_key_columns) if join_keys else [()] * table.num_rows,
+        zip(*feature_columns) if feature_names else [()] * table.num_rows,
+        event_timestamps,
+        created_timestamps,
+    ):
+        entity_key = EntityKeyProto(join_keys=join_keys, entity_values=entity_values)
+        rows_to_write.append(
+            (
+                entity_key,
+                dict(zip(feature_names, feature_values)),
+                event_timestamp,
+                created_timestamp,
+            )
+        )
+    return rows_to_write
+
+
+def serialize_arrow_for_redis(
+    table: pyarrow.Table, feature_view: FeatureView, join_keys: List[str], project: str,
+) -> List[RedisRow]:
+    """
+    Serializes a table into the (key, hash) pairs that RedisOnlineStore.online_write_batch
+    would write for it, without building any protobuf objects.
+    """
+    entity_keys = _serialize_entity_keys(table, join_keys, project.encode("utf-8"))
+
+    feature_view_name = feature_view.name
+    hash_fields = [f"_ts:{feature_view_name}", f"_ex:{feature_view_name}"]
+    hash_columns = [
+        _serialize_timestamp_seconds(
+            table.column(feature_view.batch_source.event_timestamp_column)
+        ),
+        [_serialize_timestamp_value(_EX_SECONDS)] * table.num_rows,
+    ]
+    for feature in feature_view.features:
+        hash_fields.append(_mmh3(f"{feature_view_name}:{feature.name}"))
+        hash_columns.append(_serialize_values(table.column(feature.name)))
+
+    return [
+        (entity_key, dict(zip(hash_fields, values)))
+        for entity_key, values in zip(entity_keys, zip(*hash_columns))
+    ]
+
+
+def write_serialized_rows_to_redis(
+    client,
+    rows: List[RedisRow],
+    progress: Optional[Callable[[int], Any]],
+    batch_size: int = DEFAULT_REDIS_PIPELINE_SIZE,
+) -> None:
+    """Writes pre-serialized rows with pipelined HSETs, batch_size rows per round trip"""
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start : start + batch_size]
+        pipeline = client.pipeline(transaction=False)
+        for key, mapping in batch:
+            pipeline.hset(key, mapping=mapping)
+        pipeline.execute()
+        if progress:
+            progress(len(batch))
+
+
+def _column_to_proto_values(column: pyarrow.ChunkedArray) -> List[ValueProto]:
+    """Converts a column to ValueProtos, like python_value_to_proto_value does per value"""
+    arrow_type = column.type
+    field_name = _proto_field_for_arrow_type(arrow_type)
+    if field_name is None:
+        return [python_value_to_proto_value(value) for value in column.to_pylist()]
+
+    if pyarrow.types.is_timestamp(arrow_type):
+        seconds, valid = _timestamp_seconds(column)
+        return [
+            ValueProto(int64_val=value) if is_valid else ValueProto()
+            for value, is_valid in zip(seconds.tolist(), valid.tolist())
+        ]
+
+    values = column.to_pylist()
+    if field_name == "double_val":
+        # NaN is treated as missing, like pandas.isnull
+        return [
+            ValueProto(double_val=value)
+            if value is not None and value == value
+            else ValueProto()
+            for value in values
+        ]
+    return [
+        ValueProto(**{field_name: value}) if value is not None else ValueProto()
+        for value in values
+    ]
+
+
+def _column_to_datetimes(column: pyarrow.ChunkedArray) -> List[Optional[datetime]]:
+    # Like feast's _coerce_datetime, nanosecond timestamps are truncated to the
+    # microsecond resolution of datetime
+    arrow_type = pyarrow.timestamp("us", tz=column.type.tz)
+    return column.cast(arrow_type, safe=False).to_pylist()
+
+
+def _proto_field_for_arrow_type(arrow_type: pyarrow.DataType) -> Optional[str]:
+    """
+    Returns the ValueProto field python_value_to_proto_value picks for the Python values
+    of an Arrow type, or None if the type has to be converted value by value
+    """
+    if pyarrow.types.is_integer(arrow_type):
+        return "int64_val"
+    if pyarrow.types.is_timestamp(arrow_type) and arrow_type.tz is not None:
+        # Naive datetimes are converted with datetime.timestamp(), which depends on
+        # the local timezone, so those are left to python_value_to_proto_value
+        return "int64_val"
+    if pyarrow.types.is_floating(arrow_type):
+        return "double_val"
+    if pyarrow.types.is_string(arrow_type) or pyarrow.types.is_large_string(arrow_type):
+        return "string_val"
+    if pyarrow.types.is_binary(arrow_type) or pyarrow.types.is_large_binary(arrow_type):
+        return "bytes_val"
+    if pyarrow.types.is_boolean(arrow_type):
+        return "bool_val"
+    return None
+
+
+def _serialize_values(column: pyarrow.ChunkedArray) -> List[bytes]:
+    """Returns ValueProto.SerializeToString() of every value of a column"""
+    field_name = _proto_field_for_arrow_type(column.type)
+    if field_name is None:
+        return [
+            python_value_to_proto_value(value).SerializeToString()
+            for value in column.to_pylist()
+        ]
+
+    if pyarrow.types.is_timestamp(column.type):
+        seconds, valid = _timestamp_seconds(column)
+        return _mask(_encode_varints(_INT64_VAL_TAG, seconds), valid)
+
+    if field_name == "int64_val":
+        valid = _valid_mask(column)
+        values = column.fill_null(0).to_numpy().astype(np.int64)
+        return _mask(_encode_varints(_INT64_VAL_TAG, values), valid)
+
+    if field_name == "double_val":
+        values = column.cast(pyarrow.float64()).fill_null(np.nan).to_numpy()
+        encoded = np.empty(len(values), dtype=[("tag", "u1"), ("value", "<f8")])
+        encoded["tag"] = _DOUBLE_VAL_TAG
+        encoded["value"] = values
+        return _mask(
+            np.frombuffer(encoded.tobytes(), dtype="V9").tolist(), ~np.isnan(values)
+        )
+
+    if field_name == "bool_val":
+        return [
+            _BOOL_VAL_BYTES[value] if value is not None else b""
+            for value in column.to_pylist()
+        ]
+
+    tag = bytes([_STRING_VAL_TAG if field_name == "string_val" else _BYTES_VAL_TAG])
+    serialized = []
+    for value in column.to_pylist():
+        if value is None:
+            serialized.append(b"")
+            continue
+        if isinstance(value, str):
+            value = value.encode("utf8")
+        serialized.append(tag + _encode_varint(len(value)) + value)
+    return serialized
+
+
+def _serialize_timestamp_seconds(column: pyarrow.ChunkedArray) -> List[bytes]:
+    """Returns google.protobuf.Timestamp(seconds=...).SerializeToString() per value"""
+    seconds, _ = _timestamp_seconds(column)
+    # Zero is the proto3 default and is not serialized
+    return _mask(_encode_varints(_TIMESTAMP_SECONDS_TAG, seconds), seconds != 0)
+
+
+def _serialize_timestamp_value(seconds: int) -> bytes:
+    return bytes([_TIMESTAMP_SECONDS_TAG]) + _encode_varint(seconds) if seconds else b""
+
+
+def _serialize_entity_keys(
+    table: pyarrow.Table, join_keys: List[str], suffix: bytes
+) -> List[bytes]:
+    """
+    Returns serialize_entity_key(entity_key) + suffix for every row, where entity_key
+    holds the row's join key values converted by python_value_to_proto_value
+    """
+    sorted_join_keys = sorted(join_keys)
+    header = b"".join(
+        struct.pack("<I", ValueType.STRING) + join_key.encode("utf8")
+        for join_key in sorted_join_keys
+    )
+    key_columns = [
+        _serialize_entity_key_values(table.column(join_key))
+        for join_key in sorted_join_keys
+    ]
+    if not key_columns:
+        return [header + suffix] * table.num_rows
+    return [header + b"".join(values) + suffix for values in zip(*key_columns)]
+
+
+def _serialize_entity_key_values(column: pyarrow.ChunkedArray) -> List[bytes]:
+    """Serializes join key values the way feast's key_encoding_utils._serialize_val does"""
+    if pyarrow.types.is_integer(column.type) and column.null_count == 0:
+        values = column.to_numpy().astype(np.int64)
+        # int64 values are packed with struct "<l", which is 4 bytes wide
+        if len(values) and (
+            values.min() < np.iinfo(np.int32).min
+            or values.max() > np.iinfo(np.int32).max
+        ):
+            raise ValueError("Entity key value does not fit the int64 key encoding")
+        encoded = np.empty(
+            len(values), dtype=[("type", "<u4"), ("length", "<u4"), ("value", "<i4")]
+        )
+        encoded["type"] = ValueType.INT64
+        encoded["length"] = 4
+        encoded["value"] = values
+        return np.frombuffer(encoded.tobytes(), dtype="V12").tolist()
+
+    serialized = []
+    for value in column.to_pylist():
+        if isinstance(value, int) and not isinstance(value, bool):
+            value_type, value = ValueType.INT64, struct.pack("<l", value)
+        elif isinstance(value, str):
+            value_type, value = ValueType.STRING, value.encode("utf8")
+        elif isinstance(value, bytes):
+            value_type = ValueType.BYTES
+        else:
+            raise ValueError(f"Value type not supported for entity keys: {value}")
+        serialized.append(struct.pack("<II", value_type, len(value)) + value)
+    return serialized
+
+
+def _timestamp_seconds(column: pyarrow.ChunkedArray) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns a timestamp column as seconds since the epoch and its validity mask"""
+    valid = _valid_mask(column)
+    values = column.cast(pyarrow.timestamp("s"), safe=False).fill_null(0)
+    return values.to_numpy().astype(np.int64), valid
+
+
+def _valid_mask(column: pyarrow.ChunkedArray) -> np.ndarray:
+    if column.null_count == 0:
+        return np.ones(len(column), dtype=bool)
+    return column.is_valid().to_numpy(zero_copy_only=False)
+
+
+def _mask(values: List[bytes], valid: np.ndarray) -> List[bytes]:
+    """Replaces the values where valid is False with an empty ValueProto"""
+    if valid.all():
+        return values
+    return [
+        value if is_valid else b"" for value, is_valid in zip(values, valid.tolist())
+    ]
+
+
+def _encode_varint(value: int) -> bytes:
+    value &= 0xFFFFFFFFFFFFFFFF
+    encoded = bytearray()
+    while value > 0x7F:
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def _encode_varints(tag: int, values: np.ndarray) -> List[bytes]:
+    """Encodes tag followed by the varint of each value, a byte column at a time"""
+    remaining = values.astype(np.int64).view(np.uint64)
+    encoded = np.zeros((len(values), 11), dtype=np.uint8)
+    encoded[:, 0] = tag
+    lengths = np.full(len(values), 2, dtype=np.int64)
+    for idx in range(1, 11):
+        byte = (remaining & np.uint64(0x7F)).astype(np.uint8)
+        remaining = remaining >> np.uint64(7)
+        has_more = remaining > 0
+        encoded[:, idx] = byte | (has_more.astype(np.uint8) << 7)
+        if not has_more.any():
+            break
+        lengths += has_more
+    rows = encoded.tobytes()
+    return [
+        rows[offset : offset + length]
+        for offset, length in zip(range(0, len(rows), 11), lengths.tolist())
+    ]
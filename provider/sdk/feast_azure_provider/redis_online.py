@@ -0,0 +1,106 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from feast.errors import FeastExtrasDependencyImportError
+from feast.infra.online_stores.helpers import _mmh3, _redis_key
+from feast.infra.online_stores.redis import RedisOnlineStore
+from feast.protos.feast.types.EntityKey_pb2 import EntityKey as EntityKeyProto
+from feast.protos.feast.types.Value_pb2 import Value as ValueProto
+from google.protobuf.timestamp_pb2 import Timestamp
+
+# Reads the hashes RedisOnlineStore writes, fetching only the requested feature fields
+# and sending all keys of a batch in one pipelined round trip.
+
+OnlineRow = Tuple[Optional[datetime], Optional[Dict[str, ValueProto]]]
+
+
+def read_from_redis(
+    client,
+    project: str,
+    feature_view_name: str,
+    entity_keys: Sequence[EntityKeyProto],
+    requested_features: List[str],
+) -> List[OnlineRow]:
+    """
+    Reads the requested features of a feature view for a batch of entity keys with
+    pipelined HMGETs. Entities that have no rows for the feature view are (None, None).
+    """
+    hash_fields = _get_hash_fields(feature_view_name, requested_features)
+    pipeline = client.pipeline(transaction=False)
+    for entity_key in entity_keys:
+        pipeline.hmget(_redis_key(project, entity_key), hash_fields)
+    return [
+        _parse_hash_values(requested_features, values) for values in pipeline.execute()
+    ]
+
+
+async def read_from_redis_async(
+    client,
+    project: str,
+    feature_view_name: str,
+    entity_keys: Sequence[EntityKeyProto],
+    requested_features: List[str],
+) -> List[OnlineRow]:
+    """Same as read_from_redis, using a client from create_async_redis_client"""
+    hash_fields = _get_hash_fields(feature_view_name, requested_features)
+    async with client.pipeline(transaction=False) as pipeline:
+        for entity_key in entity_keys:
+            pipeline.hmget(_redis_key(project, entity_key), hash_fields)
+        values = await pipeline.execute()
+    return [_parse_hash_values(requested_features, row) for row in values]
+
+
+def create_async_redis_client(connection_string: str, max_connections: int):
+    """
+    Creates an asyncio Redis client from a RedisOnlineStoreConfig connection string.
+    Requests wait for one of the max_connections pooled connections to be free.
+    """
+    try:
+        from redis import asyncio as aioredis
+    except ImportError:
+        try:
+            import aioredis
+        except ImportError as e:
+            raise FeastExtrasDependencyImportError("aioredis", str(e))
+
+    startup_nodes, kwargs = RedisOnlineStore._parse_connection_string(connection_string)
+    if kwargs.pop("ssl", False):
+        kwargs["connection_class"] = aioredis.SSLConnection
+    pool = aioredis.BlockingConnectionPool(
+        host=startup_nodes[0]["host"],
+        port=startup_nodes[0]["port"],
+        max_connections=max_connections,
+        **kwargs,
+    )
+    return aioredis.Redis(connection_pool=pool)
+
+
+def _get_hash_fields(feature_view_name: str, requested_features: List[str]) -> List:
+    hash_fields = [
+        _mmh3(f"{feature_view_name}:{feature_name}")
+        for feature_name in requested_features
+    ]
+    # The event timestamp is fetched last
+    hash_fields.append(f"_ts:{feature_view_name}")
+    return hash_fields
+
+
+def _parse_hash_values(
+    requested_features: List[str], values: List[Optional[bytes]]
+) -> OnlineRow:
+    ts_val = values[-1]
+    if ts_val is None:
+        return None, None
+
+    res_ts = Timestamp()
+    res_ts.ParseFromString(ts_val)
+    res = {}
+    for feature_name, val_bin in zip(requested_features, values):
+        val = ValueProto()
+        if val_bin:
+            val.ParseFromString(val_bin)
+        res[feature_name] = val
+    return datetime.fromtimestamp(res_ts.seconds), res
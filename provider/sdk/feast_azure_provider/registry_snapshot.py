@@ -0,0 +1,355 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+
+from feast.entity import Entity
+from feast.errors import (
+    EntityNotFoundException,
+    FeatureServiceNotFoundException,
+    FeatureViewNotFoundException,
+    OnDemandFeatureViewNotFoundException,
+)
+from feast.feature_service import FeatureService
+from feast.feature_view import FeatureView
+from feast.on_demand_feature_view import OnDemandFeatureView
+from feast.protos.feast.core.Entity_pb2 import Entity as EntityProto
+from feast.protos.feast.core.FeatureService_pb2 import (
+    FeatureService as FeatureServiceProto,
+)
+from feast.protos.feast.core.FeatureView_pb2 import FeatureView as FeatureViewProto
+from feast.protos.feast.core.Registry_pb2 import Registry as RegistryProto
+from feast.registry import Registry
+from feast.registry_store import RegistryStore
+from feast.repo_config import RegistryConfig
+
+from .file_utils import write_file_atomically
+
+# A snapshot file is laid out as
+#   SNAPSHOT_MAGIC | index length (uint32, little endian) | index | serialized objects
+# where the index is a JSON document giving the offset and length of every serialized
+# object, relative to the end of the index:
+#   {"registry": [offset, length],
+#    "entities": {project: {name: [offset, length]}},
+#    "feature_views": {...}, "feature_services": {...}}
+# "registry" holds the registry without its entities, feature views and services.
+SNAPSHOT_MAGIC = b"FEASTRS1"
+
+_HEADER = struct.Struct("<8sI")
+
+# Registry collections indexed by name, and the proto class of their objects
+_INDEXED_COLLECTIONS = {
+    "entities": EntityProto,
+    "feature_views": FeatureViewProto,
+    "feature_services": FeatureServiceProto,
+}
+
+
+def write_registry_snapshot(registry_proto: RegistryProto, path: str):
+    """
+    Writes registry_proto to path in the indexed snapshot format read by
+    RegistrySnapshot. The file is replaced atomically, so readers that have the
+    previous snapshot mapped keep reading it until they reopen the file.
+    """
+    chunks = []
+    offset = 0
+
+    def add(data: bytes) -> List[int]:
+        nonlocal offset
+        chunks.append(data)
+        location = [offset, len(data)]
+        offset += len(data)
+        return location
+
+    remainder = RegistryProto()
+    remainder.CopyFrom(registry_proto)
+    index: Dict = {}
+    for collection in _INDEXED_COLLECTIONS:
+        remainder.ClearField(collection)
+        index[collection] = {}
+        for proto in getattr(registry_proto, collection):
+            index[collection].setdefault(proto.spec.project, {})[proto.spec.name] = add(
+                proto.SerializeToString()
+            )
+    index["registry"] = add(remainder.SerializeToString())
+
+    index_bytes = json.dumps(index, separators=(",", ":")).encode("utf8")
+    write_file_atomically(
+        path,
+        _HEADER.pack(SNAPSHOT_MAGIC, len(index_bytes)) + index_bytes + b"".join(chunks),
+    )
+
+
+class RegistrySnapshot:
+    """
+    Read-only view of a registry snapshot written by write_registry_snapshot.
+
+    The file is memory mapped, so processes reading the same snapshot share its pages,
+    and an object is only parsed the first time it is looked up.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # Identifies the file that is mapped, a new snapshot is a new file
+        self.file_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+        magic, index_length = _HEADER.unpack_from(self._mmap, 0)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a registry snapshot")
+        index_start = _HEADER.size
+        self._data_start = index_start + index_length
+        self._index = json.loads(self._mmap[index_start : self._data_start])
+        self._protos: Dict[Tuple[str, str, str], object] = {}
+        self._registry_proto: Optional[RegistryProto] = None
+
+    def get_proto(self, collection: str, project: str, name: str):
+        """Returns the proto of an object of an indexed collection, or None"""
+        key = (collection, project, name)
+        proto = self._protos.get(key)
+        if proto is None:
+            location = self._index[collection].get(project, {}).get(name)
+            if location is None:
+                return None
+            proto = _INDEXED_COLLECTIONS[collection].FromString(self._read(location))
+            self._protos[key] = proto
+        return proto
+
+    def list_protos(self, collection: str, project: str) -> list:
+        return [
+            self.get_proto(collection, project, name)
+            for name in self._index[collection].get(project, {})
+        ]
+
+    @property
+    def registry_proto(self) -> RegistryProto:
+        """
+        The registry without its entities, feature views and feature services, i.e. its
+        on demand feature views, feature tables and metadata
+        """
+        if self._registry_proto is None:
+            self._registry_proto = RegistryProto.FromString(
+                self._read(self._index["registry"])
+            )
+        return self._registry_proto
+
+    def to_registry_proto(self) -> RegistryProto:
+        """Parses the whole registry"""
+        registry_proto = RegistryProto()
+        registry_proto.CopyFrom(self.registry_proto)
+        for collection in _INDEXED_COLLECTIONS:
+            for project in self._index[collection]:
+                getattr(registry_proto, collection).extend(
+                    self.list_protos(collection, project)
+                )
+        return registry_proto
+
+    def close(self):
+        self._mmap.close()
+
+    def _read(self, location: List[int]) -> bytes:
+        offset, length = location
+        start = self._data_start + offset
+        return self._mmap[start : start + length]
+
+
+class ReadOnlyRegistryError(Exception):
+    def __init__(self):
+        super().__init__(
+            "A registry snapshot is read-only, apply changes to the registry it is "
+            "written from"
+        )
+
+
+T = TypeVar("T")
+
+
+class SnapshotRegistryStore(RegistryStore):
+    """
+    Read-only RegistryStore of a snapshot written by write_registry_snapshot. The
+    snapshot is only accessed through read(), so that it can be closed once the file
+    was replaced.
+    """
+
+    def __init__(self, registry_config: RegistryConfig, repo_path):
+        self._path = registry_config.path
+        self._snapshot = RegistrySnapshot(self._path)
+        self._lock = threading.Lock()
+
+    def read(self, read: Callable[[RegistrySnapshot], T], reopen: bool) -> T:
+        """
+        Returns read(snapshot), after reopening the snapshot if reopen is set and the
+        file was replaced
+        """
+        with self._lock:
+            if reopen:
+                self._reopen_if_replaced()
+            return read(self._snapshot)
+
+    def get_registry_proto(self) -> RegistryProto:
+        return self.read(RegistrySnapshot.to_registry_proto, reopen=True)
+
+    def update_registry_proto(self, registry_proto: RegistryProto):
+        raise ReadOnlyRegistryError()
+
+    def teardown(self):
+        raise ReadOnlyRegistryError()
+
+    def _reopen_if_replaced(self):
+        try:
+            stat = os.stat(self._path)
+        except OSError:
+            return
+        if (stat.st_ino, stat.st_mtime_ns, stat.st_size) != self._snapshot.file_id:
+            previous_snapshot = self._snapshot
+            self._snapshot = RegistrySnapshot(self._path)
+            previous_snapshot.close()
+
+
+class SnapshotRegistry(Registry):
+    """
+    Read-only Registry serving lookups from a snapshot written by
+    write_registry_snapshot, for serving processes, e.g. gunicorn workers, that only
+    read the registry:
+
+        store = FeatureStore(repo_path=".")
+        store._registry = SnapshotRegistry(snapshot_path)
+
+    Lookups of a single object only parse that object. The snapshot is reopened when
+    the file at snapshot_path was replaced and the registry cache ttl expired, or on
+    refresh(). Changes raise ReadOnlyRegistryError.
+    """
+
+    def __init__(self, snapshot_path: str, cache_ttl_seconds: int = 0):
+        super().__init__(
+            RegistryConfig(
+                path=snapshot_path,
+                registry_store_type=f"{__name__}.SnapshotRegistryStore",
+                cache_ttl_seconds=cache_ttl_seconds,
+            ),
+            None,
+        )
+        self._checked_at = time.monotonic()
+        # Snapshot file cached_registry_proto was parsed from
+        self._parsed_file_id: Optional[Tuple[int, int, int]] = None
+
+    def list_entities(self, project: str, allow_cache: bool = False) -> List[Entity]:
+        return [
+            Entity.from_proto(entity_proto)
+            for entity_proto in self._read(
+                allow_cache, lambda snapshot: snapshot.list_protos("entities", project)
+            )
+        ]
+
+    def get_entity(self, name: str, project: str, allow_cache: bool = False) -> Entity:
+        entity_proto = self._read(
+            allow_cache, lambda snapshot: snapshot.get_proto("entities", project, name)
+        )
+        if entity_proto is None:
+            raise EntityNotFoundException(name, project=project)
+        return Entity.from_proto(entity_proto)
+
+    def list_feature_views(
+        self, project: str, allow_cache: bool = False
+    ) -> List[FeatureView]:
+        return [
+            FeatureView.from_proto(feature_view_proto)
+            for feature_view_proto in self._read(
+                allow_cache,
+                lambda snapshot: snapshot.list_protos("feature_views", project),
+            )
+        ]
+
+    def get_feature_view(self, name: str, project: str) -> FeatureView:
+        feature_view_proto = self._read(
+            False, lambda snapshot: snapshot.get_proto("feature_views", project, name)
+        )
+        if feature_view_proto is None:
+            raise FeatureViewNotFoundException(name, project)
+        return FeatureView.from_proto(feature_view_proto)
+
+    def list_feature_services(
+        self, project: str, allow_cache: bool = False
+    ) -> List[FeatureService]:
+        return [
+            FeatureService.from_proto(feature_service_proto)
+            for feature_service_proto in self._read(
+                allow_cache,
+                lambda snapshot: snapshot.list_protos("feature_services", project),
+            )
+        ]
+
+    def get_feature_service(
+        self, name: str, project: str, allow_cache: bool = False
+    ) -> FeatureService:
+        feature_service_proto = self._read(
+            allow_cache,
+            lambda snapshot: snapshot.get_proto("feature_services", project, name),
+        )
+        if feature_service_proto is None:
+            raise FeatureServiceNotFoundException(name, project=project)
+        return FeatureService.from_proto(feature_service_proto)
+
+    def list_on_demand_feature_views(
+        self, project: str, allow_cache: bool = False
+    ) -> List[OnDemandFeatureView]:
+        registry_proto = self._read(
+            allow_cache, lambda snapshot: snapshot.registry_proto
+        )
+        return [
+            OnDemandFeatureView.from_proto(on_demand_feature_view_proto)
+            for on_demand_feature_view_proto in registry_proto.on_demand_feature_views
+            if on_demand_feature_view_proto.spec.project == project
+        ]
+
+    def get_on_demand_feature_view(
+        self, name: str, project: str, allow_cache: bool = False
+    ) -> OnDemandFeatureView:
+        for on_demand_feature_view in self.list_on_demand_feature_views(
+            project, allow_cache
+        ):
+            if on_demand_feature_view.name == name:
+                return on_demand_feature_view
+        raise OnDemandFeatureViewNotFoundException(name, project=project)
+
+    def refresh(self):
+        self._read(False, lambda snapshot: None)
+
+    def commit(self):
+        raise ReadOnlyRegistryError()
+
+    def teardown(self):
+        raise ReadOnlyRegistryError()
+
+    def _prepare_registry_for_changes(self):
+        raise ReadOnlyRegistryError()
+
+    def _get_registry_proto(self, allow_cache: bool = False) -> RegistryProto:
+        # Only used by the lookups that are not served from the index
+        return self._read(allow_cache, self._parse_registry_proto)
+
+    def _parse_registry_proto(self, snapshot: RegistrySnapshot) -> RegistryProto:
+        if self._parsed_file_id != snapshot.file_id:
+            self.cached_registry_proto = snapshot.to_registry_proto()
+            self.cached_registry_proto_created = datetime.now()
+            self._parsed_file_id = snapshot.file_id
+        return self.cached_registry_proto
+
+    def _read(self, allow_cache: bool, read: Callable[[RegistrySnapshot], T]) -> T:
+        # The file is checked for a new snapshot if the cache isn't allowed or expired
+        ttl_seconds = self.cached_registry_proto_ttl.total_seconds()
+        reopen = not allow_cache or (
+            ttl_seconds > 0 and time.monotonic() - self._checked_at > ttl_seconds
+        )
+        if reopen:
+            self._checked_at = time.monotonic()
+        return self._registry_store.read(read, reopen)
@@ -1,38 +1,97 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT license.
 
+import hashlib
+import logging
 import os
+import shutil
+import tempfile
+import threading
 import uuid
+from collections import OrderedDict
 
 from feast.protos.feast.core.Registry_pb2 import Registry as RegistryProto
 from feast.registry import RegistryConfig
 from feast.registry_store import RegistryStore
+
+from .file_utils import write_file_atomically
+from .registry_snapshot import write_registry_snapshot
 from pathlib import Path
 from datetime import datetime
 from urllib.parse import urlparse
-from tempfile import TemporaryFile
 
 REGISTRY_SCHEMA_VERSION = "1"
 
+# Directory the local registry snapshots are kept in, set it to a persistent volume
+# to let pods start from the snapshot of their previous run
+REGISTRY_SNAPSHOT_DIR = os.environ.get(
+    "FEAST_REGISTRY_SNAPSHOT_DIR",
+    os.path.join(tempfile.gettempdir(), "feast_registry_snapshots"),
+)
+
+# File of a snapshot directory naming the current snapshot and the blob ETag it has
+_CURRENT_SNAPSHOT_FILE = "CURRENT"
+
+# File of a snapshot directory holding the current snapshot in the indexed format
+# read by registry_snapshot.SnapshotRegistry
+INDEXED_SNAPSHOT_FILE = "registry.snapshot"
+
+# Number of registry versions whose ETag is kept, to upload changes with the ETag of
+# the version they were made to
+_TRACKED_VERSIONS = 16
+
+
+def get_indexed_snapshot_path(registry_path: str) -> str:
+    """
+    Returns the path of the indexed snapshot AzBlobRegistryStore keeps of the registry
+    at registry_path, for serving processes to open with SnapshotRegistry
+    """
+    return os.path.join(_get_snapshot_dir(registry_path), INDEXED_SNAPSHOT_FILE)
+
+
+def _get_snapshot_dir(registry_path: str) -> str:
+    return os.path.join(
+        REGISTRY_SNAPSHOT_DIR, hashlib.sha1(registry_path.encode("utf8")).hexdigest()
+    )
+
 
 class AzBlobRegistryStore(RegistryStore):
     def __init__(self, registry_config: RegistryConfig, repo_path: Path):
+        self._uri = urlparse(registry_config.path)
+        self._account_url = self._uri.scheme + "://" + self._uri.netloc
+        container_path = self._uri.path.lstrip("/").split("/")
+        self._container = container_path.pop(0)
+        self._path = "/".join(container_path)
+        self._etag = None
+        self._registry_proto = None
+        # ETags of the recent registry versions by version_id
+        self._version_etags: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+        self._snapshot_dir = _get_snapshot_dir(registry_config.path)
+        self._load_snapshot()
+
+        # The credential and blob client are created on first use, so a store that
+        # starts from a snapshot does not wait for them
+        self._blob = None
+        self._blob_lock = threading.Lock()
+
+    @property
+    def blob(self):
+        with self._blob_lock:
+            if self._blob is None:
+                self._blob = self._create_blob_client()
+        return self._blob
+
+    def _create_blob_client(self):
         try:
-            from azure.storage.blob import BlobClient
             from azure.identity import DefaultAzureCredential
             from azure.storage.blob import BlobServiceClient
-            import logging
         except ImportError as e:
             from feast.errors import FeastExtrasDependencyImportError
 
             raise FeastExtrasDependencyImportError("az", str(e))
 
-        self._uri = urlparse(registry_config.path)
-        self._account_url = self._uri.scheme + "://" + self._uri.netloc
-        container_path = self._uri.path.lstrip("/").split("/")
-        self._container = container_path.pop(0)
-        self._path = "/".join(container_path)
-
         try:
             # turn the verbosity of the blob client to warning and above (this reduces verbosity)
             logger = logging.getLogger("azure")
@@ -44,43 +103,177 @@ class AzBlobRegistryStore(RegistryStore):
             client = BlobServiceClient(
                 account_url=self._account_url, credential=default_credential
             )
-            self.blob = client.get_blob_client(
-                container=self._container, blob=self._path
-            )
+            return client.get_blob_client(container=self._container, blob=self._path)
         except:
             print(
                 "Could not connect to blob. Check the following\nIs the URL specified correctly?\nIs you IAM role set to Storage Blob Data Contributor?\n"
             )
-
-        return
+            raise
 
     def get_registry_proto(self):
-        file_obj = TemporaryFile()
-        registry_proto = RegistryProto()
-
-        if self.blob.exists():
-            download_stream = self.blob.download_blob()
-            file_obj.write(download_stream.readall())
+        if self._registry_proto is None:
+            # Without a snapshot the first read has to wait for the download
+            self._refresh()
+            return self._registry_proto
 
-            file_obj.seek(0)
-            registry_proto.ParseFromString(file_obj.read())
-            return registry_proto
-        raise FileNotFoundError(
-            f'Registry not found at path "{self._uri.geturl()}". Have you run "feast apply"?'
-        )
+        # Readers get the current registry at once, a newer one is fetched in the
+        # background and returned by later reads. A refresh replaces the proto
+        # instead of changing it, so the proto handed out here stays as it is.
+        with self._lock:
+            if self._refresh_thread is None or not self._refresh_thread.is_alive():
+                self._refresh_thread = threading.Thread(
+                    target=self._refresh_in_background, daemon=True
+                )
+                self._refresh_thread.start()
+            return self._registry_proto
 
     def update_registry_proto(self, registry_proto: RegistryProto):
-        self._write_registry(registry_proto)
+        try:
+            self._write_registry(registry_proto)
+        except Exception:
+            # The changes were made to a stale registry or the upload failed. The
+            # proto readers get may hold the changes, so the current registry is
+            # downloaded even if it is unchanged, and the changes can be made again.
+            try:
+                self._refresh(conditional=False)
+            except Exception:
+                logging.getLogger(__name__).warning(
+                    f"Could not refresh the registry from {self._uri.geturl()}",
+                    exc_info=True,
+                )
+            raise
 
     def teardown(self):
         self.blob.delete_blob()
+        with self._lock:
+            self._etag = None
+            self._registry_proto = None
+            self._version_etags.clear()
+        shutil.rmtree(self._snapshot_dir, ignore_errors=True)
+
+    def _refresh(self, conditional: bool = True):
+        from azure.core import MatchConditions
+        from azure.core.exceptions import (
+            ResourceNotFoundError,
+            ResourceNotModifiedError,
+        )
+
+        # Once the registry has been downloaded it is only downloaded again if its
+        # ETag changed
+        etag = self._etag if conditional else None
+        try:
+            if etag is None:
+                download_stream = self.blob.download_blob()
+            else:
+                download_stream = self.blob.download_blob(
+                    etag=etag, match_condition=MatchConditions.IfModified
+                )
+        except ResourceNotModifiedError:
+            return
+        except ResourceNotFoundError:
+            raise FileNotFoundError(
+                f'Registry not found at path "{self._uri.geturl()}". Have you run "feast apply"?'
+            )
+
+        registry_proto = RegistryProto()
+        registry_proto.ParseFromString(download_stream.readall())
+        self._set_registry(registry_proto, download_stream.properties.etag)
+
+    def _refresh_in_background(self):
+        try:
+            self._refresh()
+        except Exception:
+            logging.getLogger(__name__).warning(
+                f"Could not refresh the registry from {self._uri.geturl()}, "
+                f"the local snapshot is used until the next refresh",
+                exc_info=True,
+            )
 
     def _write_registry(self, registry_proto: RegistryProto):
+        from azure.core import MatchConditions
+
+        # The upload fails if the blob changed since the version the changes were
+        # made to, so changes based on a stale snapshot cannot overwrite newer changes
+        with self._lock:
+            etag = self._version_etags.get(registry_proto.version_id, self._etag)
+
         registry_proto.version_id = str(uuid.uuid4())
         registry_proto.last_updated.FromDatetime(datetime.utcnow())
 
-        file_obj = TemporaryFile()
-        file_obj.write(registry_proto.SerializeToString())
-        file_obj.seek(0)
-        self.blob.upload_blob(file_obj, overwrite=True)
+        if etag is None:
+            result = self.blob.upload_blob(
+                registry_proto.SerializeToString(), overwrite=True
+            )
+        else:
+            result = self.blob.upload_blob(
+                registry_proto.SerializeToString(),
+                overwrite=True,
+                etag=etag,
+                match_condition=MatchConditions.IfNotModified,
+            )
+        # The caller keeps changing its proto, e.g. feast's cached registry proto
+        self._set_registry(_copy_registry_proto(registry_proto), result["etag"])
         return
+
+    def _set_registry(self, registry_proto: RegistryProto, etag: str):
+        with self._lock:
+            self._registry_proto = registry_proto
+            self._etag = etag
+            self._track_version(registry_proto.version_id, etag)
+        try:
+            self._write_snapshot(registry_proto, etag)
+        except OSError:
+            logging.getLogger(__name__).warning(
+                f"Could not write the registry snapshot to {self._snapshot_dir}",
+                exc_info=True,
+            )
+
+    def _load_snapshot(self):
+        try:
+            with open(os.path.join(self._snapshot_dir, _CURRENT_SNAPSHOT_FILE)) as f:
+                version_id, etag = f.read().split()
+            with open(os.path.join(self._snapshot_dir, f"{version_id}.pb"), "rb") as f:
+                registry_proto = RegistryProto.FromString(f.read())
+        except (OSError, ValueError):
+            return
+        self._registry_proto = registry_proto
+        self._etag = etag
+        self._track_version(registry_proto.version_id, etag)
+
+    def _track_version(self, version_id: str, etag: str):
+        self._version_etags[version_id] = etag
+        self._version_etags.move_to_end(version_id)
+        while len(self._version_etags) > _TRACKED_VERSIONS:
+            self._version_etags.popitem(last=False)
+
+    def _write_snapshot(self, registry_proto: RegistryProto, etag: str):
+        """
+        Writes the registry to <version_id>.pb and then points the CURRENT file at it,
+        and writes it to INDEXED_SNAPSHOT_FILE. All files are replaced atomically, so
+        processes sharing the directory never read a partial snapshot.
+        """
+        os.makedirs(self._snapshot_dir, exist_ok=True)
+        snapshot_file = f"{registry_proto.version_id}.pb"
+        write_file_atomically(
+            os.path.join(self._snapshot_dir, snapshot_file),
+            registry_proto.SerializeToString(),
+        )
+        write_file_atomically(
+            os.path.join(self._snapshot_dir, _CURRENT_SNAPSHOT_FILE),
+            f"{registry_proto.version_id} {etag}".encode("utf8"),
+        )
+        write_registry_snapshot(
+            registry_proto, os.path.join(self._snapshot_dir, INDEXED_SNAPSHOT_FILE)
+        )
+        for file_name in os.listdir(self._snapshot_dir):
+            if file_name.endswith(".pb") and file_name != snapshot_file:
+                try:
+                    os.remove(os.path.join(self._snapshot_dir, file_name))
+                except OSError:
+                    pass
+
+
+def _copy_registry_proto(registry_proto: RegistryProto) -> RegistryProto:
+    registry_copy = RegistryProto()
+    registry_copy.CopyFrom(registry_proto)
+    return registry_copy
@@ -35,7 +35,11 @@ setup(
         "sqlalchemy>=1.4",
         "msal==1.13.0"
     ],
-    extras_require={"dev": ["pytest", "mypy", "assertpy"]},
+    extras_require={
+        "dev": ["pytest", "mypy", "assertpy"],
+        # asyncio Redis client for AzureProvider.online_read_async, redis>=4.2 ships one too
+        "async": ["aioredis>=2.0.0"],
+    },
     # https://stackoverflow.com/questions/28509965/setuptools-development-requirements
     # Install dev requirements with: pip install -e .[dev]
     include_package_data=True,
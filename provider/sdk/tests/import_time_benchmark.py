@@ -0,0 +1,28 @@
+import subprocess
+import sys
+import time
+
+# Measures how long a fresh interpreter takes to import the modules of the package.
+# "feast" is the baseline every module pays for, run with -X importtime to see the
+# slowest imports of a single module:
+#   python -X importtime -c "import feast_azure_provider.feature_store_client"
+MODULES = [
+    "feast",
+    "feast_azure_provider.azure_provider",
+    "feast_azure_provider.registry_store",
+    "feast_azure_provider.mssqlserver_source",
+    "feast_azure_provider.mssqlserver",
+    "feast_azure_provider.feature_store_client",
+]
+RUNS = 5
+
+
+def import_time(module):
+    began = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], check=True)
+    return time.perf_counter() - began
+
+
+for module in MODULES:
+    timings = sorted(import_time(module) for _ in range(RUNS))
+    print(f"{module}: best {timings[0]:.2f}s, median {timings[RUNS // 2]:.2f}s")
@@ -0,0 +1,102 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+
+from feast_azure_provider.mssqlserver import (
+    FeatureViewQueryContext,
+    MsSqlServerRetrievalJob,
+    _bulk_upload_entity_df,
+    _get_entity_df_timestamp_bounds,
+    _upload_entity_df_into_sqlserver_and_get_entity_schema,
+    build_point_in_time_query,
+)
+
+# Compares the "max_join" and "window" point-in-time join strategies on synthetic data.
+# Set FEAST_SQL_CONN to the SQLAlchemy connection string of a scratch database.
+sql_conn_string = os.environ["FEAST_SQL_CONN"]
+engine = create_engine(sql_conn_string)
+
+SIZES = [10_000, 100_000, 1_000_000]
+NUM_DRIVERS = 1_000
+FEATURE_ROWS_PER_ENTITY_ROW = 10
+start = datetime(2021, 1, 1)
+
+
+def random_timestamps(size):
+    return pd.to_datetime(start) + pd.to_timedelta(
+        np.random.randint(0, 30 * 24 * 3600, size=size), unit="s"
+    )
+
+
+for size in SIZES:
+    feature_rows = size * FEATURE_ROWS_PER_ENTITY_ROW
+    feature_df = pd.DataFrame(
+        {
+            "driver_id": np.random.randint(0, NUM_DRIVERS, size=feature_rows),
+            "event_timestamp": random_timestamps(feature_rows),
+            "conv_rate": np.random.rand(feature_rows),
+        }
+    )
+    # Rows can tie on (driver_id, event_timestamp), both strategies pick the same one
+    feature_df["created"] = feature_df["event_timestamp"] + timedelta(minutes=1)
+    entity_df = pd.DataFrame(
+        {
+            "driver_id": np.random.randint(0, NUM_DRIVERS, size=size),
+            "event_timestamp": random_timestamps(size),
+        }
+    )
+
+    feature_table = f"feast_benchmark_features_{size}"
+    _bulk_upload_entity_df(
+        engine, feature_table, feature_df, ["driver_id", "event_timestamp"]
+    )
+    entity_schema, entity_table = _upload_entity_df_into_sqlserver_and_get_entity_schema(
+        engine, None, entity_df, {"driver_id"}
+    )
+    min_timestamp, max_timestamp = _get_entity_df_timestamp_bounds(
+        engine, entity_df, entity_table, "event_timestamp"
+    )
+
+    context = FeatureViewQueryContext(
+        name="driver_stats",
+        ttl=int(timedelta(days=7).total_seconds()),
+        entities=["driver_id"],
+        features=["conv_rate"],
+        table_ref=feature_table,
+        event_timestamp_column="event_timestamp",
+        created_timestamp_column="created",
+        table_subquery=feature_table,
+        entity_selections=["driver_id AS driver_id"],
+    )
+
+    results = {}
+    for strategy in ["max_join", "window"]:
+        query = build_point_in_time_query(
+            [context],
+            min_timestamp=min_timestamp,
+            max_timestamp=max_timestamp,
+            left_table_query_string=entity_table,
+            entity_df_event_timestamp_col="event_timestamp",
+            entity_df_columns=list(entity_schema.keys()),
+            pit_join_strategy=strategy,
+        )
+        job = MsSqlServerRetrievalJob(
+            query, engine, None, full_feature_names=False, on_demand_feature_views=None
+        )
+        began = time.perf_counter()
+        results[strategy] = job.to_df()
+        elapsed = time.perf_counter() - began
+        print(f"{size} entity rows, {strategy}: {elapsed:.2f}s")
+
+    columns = ["driver_id", "event_timestamp", "conv_rate"]
+    expected = results["max_join"].sort_values(columns).reset_index(drop=True)
+    actual = results["window"].sort_values(columns).reset_index(drop=True)
+    pd.testing.assert_frame_equal(expected[columns], actual[columns])
+
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"DROP TABLE {feature_table}")
+        conn.exec_driver_sql(f"DROP TABLE {entity_table}")
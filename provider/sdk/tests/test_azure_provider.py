@@ -0,0 +1,427 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pyarrow
+import pydantic
+import pytest
+from feast.protos.feast.core.FeatureView_pb2 import FeatureView as FeatureViewProto
+from feast.protos.feast.types.EntityKey_pb2 import EntityKey as EntityKeyProto
+from feast.protos.feast.types.Value_pb2 import Value as ValueProto
+from tqdm import tqdm
+
+from feast_azure_provider import azure_provider
+from feast_azure_provider.azure_provider import AzureProvider
+from feast_azure_provider.mssqlserver import Watermark
+
+START_DATE = datetime(2021, 4, 1)
+END_DATE = datetime(2021, 4, 13)
+TIMESTAMP = datetime(2021, 4, 12, 10, 59, 42)
+
+FEATURE_VIEW = SimpleNamespace(
+    name="driver_hourly_stats",
+    entities=["driver"],
+    features=[SimpleNamespace(name="conv_rate")],
+    ttl=timedelta(hours=1),
+    batch_source=SimpleNamespace(
+        field_mapping={},
+        event_timestamp_column="event_timestamp",
+        created_timestamp_column="",
+        watermark_column=None,
+    ),
+)
+REGISTRY = SimpleNamespace(
+    get_entity=lambda name, project: SimpleNamespace(join_key="driver_id")
+)
+
+
+def entity_key(driver_id):
+    return EntityKeyProto(
+        join_keys=["driver_id"], entity_values=[ValueProto(int64_val=driver_id)]
+    )
+
+
+def row(conv_rate):
+    return TIMESTAMP, {"conv_rate": ValueProto(double_val=conv_rate)}
+
+
+class FakeOfflineStore:
+    def __init__(self):
+        self.pulls = []
+        self.watermarks = {}
+        self.current_watermark = None
+
+    def get_materialization_watermark(self, config, project, feature_view_name):
+        return self.watermarks.get(feature_view_name)
+
+    def get_current_watermark(self, config, data_source, watermark_column):
+        return self.current_watermark
+
+    def update_materialization_watermark(
+        self, config, project, feature_view_name, watermark
+    ):
+        self.watermarks[feature_view_name] = watermark
+
+    def pull_latest_from_table_or_query(self, **kwargs):
+        self.pulls.append(kwargs)
+        table = pyarrow.table(
+            {
+                "driver_id": pyarrow.array([], pyarrow.int64()),
+                "conv_rate": pyarrow.array([], pyarrow.float64()),
+                "event_timestamp": pyarrow.array([], pyarrow.timestamp("us")),
+            }
+        )
+        return SimpleNamespace(to_arrow=lambda: table)
+
+
+class FakeOnlineStore:
+    def __init__(self):
+        self.rows = {}
+        self.reads = 0
+        self.batches = []
+
+    def online_read(self, config, table, entity_keys, requested_features=None):
+        self.reads += 1
+        self.batches.append((len(entity_keys), requested_features))
+        self.thread = threading.current_thread()
+        return [
+            self.rows.get(key.SerializeToString(), (None, None)) for key in entity_keys
+        ]
+
+
+def make_provider(monkeypatch, online_store=None, **provider_options):
+    offline_store = FakeOfflineStore()
+    online_store = online_store or FakeOnlineStore()
+    monkeypatch.setattr(
+        azure_provider, "get_offline_store_from_config", lambda config: offline_store
+    )
+    monkeypatch.setattr(
+        azure_provider, "get_online_store_from_config", lambda config: online_store
+    )
+    config = SimpleNamespace(
+        project="test",
+        offline_store=SimpleNamespace(),
+        online_store=SimpleNamespace(),
+        provider_options=provider_options,
+    )
+    return AzureProvider(config), config
+
+
+def materialize(provider, config, feature_view=FEATURE_VIEW):
+    provider.materialize_single_feature_view(
+        config,
+        feature_view,
+        START_DATE,
+        END_DATE,
+        REGISTRY,
+        config.project,
+        lambda length: tqdm(total=length, disable=True),
+    )
+
+
+def test_online_reads_are_not_cached_by_default(monkeypatch):
+    online_store = FakeOnlineStore()
+    provider, config = make_provider(monkeypatch, online_store)
+
+    for _ in range(2):
+        provider.online_read(config, FEATURE_VIEW, [entity_key(1001)])
+
+    assert provider.online_cache is None
+    assert online_store.reads == 2
+
+
+def test_materialization_drops_cached_rows(monkeypatch):
+    online_store = FakeOnlineStore()
+    online_store.rows[entity_key(1001).SerializeToString()] = row(0.5)
+    provider, config = make_provider(
+        monkeypatch, online_store, online_cache_max_bytes=10_000
+    )
+
+    assert provider.online_read(config, FEATURE_VIEW, [entity_key(1001)]) == [row(0.5)]
+    online_store.rows[entity_key(1001).SerializeToString()] = row(0.7)
+    assert provider.online_read(config, FEATURE_VIEW, [entity_key(1001)]) == [row(0.5)]
+    assert online_store.reads == 1
+
+    materialize(provider, config)
+
+    assert provider.online_read(config, FEATURE_VIEW, [entity_key(1001)]) == [row(0.7)]
+    assert online_store.reads == 2
+
+
+def test_unknown_provider_options_are_rejected(monkeypatch):
+    with pytest.raises(pydantic.ValidationError):
+        make_provider(monkeypatch, online_cache_max_byte=10_000)
+
+
+def test_materialization_pulls_every_entity_hash_partition(monkeypatch):
+    provider, config = make_provider(
+        monkeypatch, materialization_chunks=4, materialization_parallelism=2
+    )
+
+    materialize(provider, config)
+
+    assert sorted(
+        pull["entity_hash_partition"] for pull in provider.offline_store.pulls
+    ) == [(0, 4), (1, 4), (2, 4), (3, 4)]
+
+
+def test_feature_views_without_entities_are_pulled_in_one_chunk(monkeypatch):
+    provider, config = make_provider(monkeypatch, materialization_chunks=4)
+    feature_view = SimpleNamespace(**{**vars(FEATURE_VIEW), "entities": []})
+
+    materialize(provider, config, feature_view)
+
+    assert len(provider.offline_store.pulls) == 1
+    assert "entity_hash_partition" not in provider.offline_store.pulls[0]
+
+
+def feature_view_named(name):
+    return SimpleNamespace(
+        **{**vars(FEATURE_VIEW), "name": name},
+        to_proto=lambda: FeatureViewProto(),
+    )
+
+
+@pytest.fixture
+def worker_chunks(monkeypatch):
+    """Runs materialization workers on threads and records the chunks they are given"""
+    chunks = []
+    monkeypatch.setattr(azure_provider, "ProcessPoolExecutor", ThreadPoolExecutor)
+    monkeypatch.setattr(azure_provider, "_worker_provider", None)
+    monkeypatch.setattr(
+        azure_provider,
+        "_materialize_chunk_in_worker",
+        lambda *args: chunks.append(args),
+    )
+    return chunks
+
+
+def test_single_feature_view_is_materialized_on_worker_processes(
+    monkeypatch, worker_chunks
+):
+    provider, config = make_provider(
+        monkeypatch,
+        materialization_chunks=2,
+        materialization_processes=2,
+        materialization_retries=3,
+    )
+
+    materialize(provider, config, feature_view_named("driver_hourly_stats"))
+
+    assert sorted(chunk[4] for chunk in worker_chunks) == [(0, 2), (1, 2)]
+    assert {chunk[5] for chunk in worker_chunks} == {3}
+    assert provider.offline_store.pulls == []
+
+
+def test_materialized_interval_is_recorded_for_every_feature_view(
+    monkeypatch, worker_chunks
+):
+    applied = []
+    registry = SimpleNamespace(
+        get_entity=REGISTRY.get_entity,
+        apply_materialization=lambda feature_view, *args: applied.append(
+            feature_view.name
+        ),
+    )
+    provider, config = make_provider(
+        monkeypatch, materialization_chunks=2, materialization_processes=2
+    )
+
+    provider.materialize_feature_views(
+        config,
+        [feature_view_named("a"), feature_view_named("b")],
+        START_DATE,
+        END_DATE,
+        registry,
+        config.project,
+        lambda length: tqdm(total=length, disable=True),
+    )
+
+    assert len(worker_chunks) == 4
+    assert sorted(applied) == ["a", "b"]
+
+
+class FlakyWorkerProvider:
+    def __init__(self, failures):
+        self.failures = failures
+        self.repo_config = SimpleNamespace()
+        self.attempts = 0
+
+    def _materialize_chunk(self, *args):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise ConnectionError("database unavailable")
+
+
+@pytest.mark.parametrize("failures, retries", [(2, 2), (3, 2)])
+def test_failed_chunks_are_retried_after_jittered_backoff(
+    monkeypatch, failures, retries
+):
+    sleeps = []
+    worker_provider = FlakyWorkerProvider(failures)
+    monkeypatch.setattr(azure_provider, "_worker_provider", worker_provider)
+    monkeypatch.setattr(
+        azure_provider,
+        "FeatureView",
+        SimpleNamespace(from_proto=lambda proto: FEATURE_VIEW),
+    )
+    monkeypatch.setattr(azure_provider.time, "sleep", sleeps.append)
+    monkeypatch.setattr(azure_provider.random, "uniform", lambda low, high: high)
+
+    args = (b"", None, START_DATE, END_DATE, (0, 2), retries)
+    if failures > retries:
+        with pytest.raises(ConnectionError):
+            azure_provider._materialize_chunk_in_worker(*args)
+    else:
+        azure_provider._materialize_chunk_in_worker(*args)
+
+    assert worker_provider.attempts == min(failures, retries) + 1
+    assert sleeps == [1.0, 2.0]
+
+
+def test_retry_backoff_is_capped(monkeypatch):
+    monkeypatch.setattr(azure_provider.random, "uniform", lambda low, high: high)
+
+    assert azure_provider._retry_backoff(3) == 8.0
+    assert (
+        azure_provider._retry_backoff(10)
+        == azure_provider.MATERIALIZATION_RETRY_BACKOFF_MAX
+    )
+
+
+def test_incremental_materialization_pulls_entities_changed_since_the_watermark(
+    monkeypatch,
+):
+    provider, config = make_provider(monkeypatch, incremental_materialization=True)
+    offline_store = provider.offline_store
+    feature_view = SimpleNamespace(
+        **{
+            **vars(FEATURE_VIEW),
+            "batch_source": SimpleNamespace(
+                **{
+                    **vars(FEATURE_VIEW.batch_source),
+                    "created_timestamp_column": "created",
+                }
+            ),
+        }
+    )
+
+    offline_store.current_watermark = Watermark.from_value(1)
+    materialize(provider, config, feature_view)
+    assert "changed_since" not in offline_store.pulls[-1]
+    assert offline_store.watermarks == {feature_view.name: Watermark.from_value(1)}
+
+    materialize(provider, config, feature_view)
+    assert len(offline_store.pulls) == 1
+
+    offline_store.current_watermark = Watermark.from_value(2)
+    materialize(provider, config, feature_view)
+    assert offline_store.pulls[-1]["changed_since"] == (
+        "created",
+        Watermark.from_value(1),
+    )
+    assert offline_store.watermarks == {feature_view.name: Watermark.from_value(2)}
+
+
+def test_online_read_splits_keys_into_batches_in_order(monkeypatch):
+    online_store = FakeOnlineStore()
+    for driver_id in range(250):
+        online_store.rows[entity_key(driver_id).SerializeToString()] = row(driver_id)
+    provider, config = make_provider(monkeypatch, online_store)
+
+    result = provider.online_read(
+        config, FEATURE_VIEW, [entity_key(driver_id) for driver_id in range(250)]
+    )
+
+    assert result == [row(driver_id) for driver_id in range(250)]
+    assert sorted(online_store.batches) == [
+        (50, ["conv_rate"]),
+        (100, ["conv_rate"]),
+        (100, ["conv_rate"]),
+    ]
+
+
+def test_online_read_passes_the_requested_features_down(monkeypatch):
+    online_store = FakeOnlineStore()
+    provider, config = make_provider(monkeypatch, online_store)
+
+    provider.online_read(
+        config, FEATURE_VIEW, [entity_key(1001)], requested_features=["acc_rate"]
+    )
+
+    assert online_store.batches == [(1, ["acc_rate"])]
+
+
+def test_async_read_of_other_online_stores_runs_off_the_event_loop(monkeypatch):
+    online_store = FakeOnlineStore()
+    online_store.rows[entity_key(1001).SerializeToString()] = row(0.5)
+    provider, config = make_provider(monkeypatch, online_store)
+
+    async def read():
+        return (
+            await provider.online_read_async(config, FEATURE_VIEW, [entity_key(1001)]),
+            threading.current_thread(),
+        )
+
+    result, event_loop_thread = asyncio.run(read())
+
+    assert result == [row(0.5)]
+    assert online_store.thread is not event_loop_thread
+
+
+def test_async_read_of_redis_reads_batches_concurrently(monkeypatch):
+    clients, batches = [], []
+    online_store = type(
+        "FakeRedisOnlineStore", (azure_provider.RedisOnlineStore,), {}
+    )()
+    provider, config = make_provider(monkeypatch, online_store)
+    config.online_store = SimpleNamespace(
+        redis_type=azure_provider.RedisType.redis, connection_string="localhost:6379"
+    )
+
+    def create_async_redis_client(connection_string, max_connections):
+        clients.append(connection_string)
+        return SimpleNamespace()
+
+    async def read_from_redis_async(
+        client, project, feature_view_name, entity_keys, requested_features
+    ):
+        batches.append(len(entity_keys))
+        await asyncio.sleep(0)
+        return [row(key.entity_values[0].int64_val) for key in entity_keys]
+
+    monkeypatch.setattr(
+        azure_provider, "create_async_redis_client", create_async_redis_client
+    )
+    monkeypatch.setattr(azure_provider, "read_from_redis_async", read_from_redis_async)
+    entity_keys = [entity_key(driver_id) for driver_id in range(250)]
+
+    async def read():
+        return [
+            await provider.online_read_async(config, FEATURE_VIEW, entity_keys)
+            for _ in range(2)
+        ]
+
+    for result in asyncio.run(read()):
+        assert result == [row(driver_id) for driver_id in range(250)]
+    assert batches == [100, 100, 50] * 2
+    assert clients == ["localhost:6379"]
+
+
+def test_async_read_is_served_from_the_online_cache(monkeypatch):
+    online_store = FakeOnlineStore()
+    online_store.rows[entity_key(1001).SerializeToString()] = row(0.5)
+    provider, config = make_provider(
+        monkeypatch, online_store, online_cache_max_bytes=10_000
+    )
+
+    async def read():
+        return [
+            await provider.online_read_async(config, FEATURE_VIEW, [entity_key(1001)])
+            for _ in range(2)
+        ]
+
+    assert asyncio.run(read()) == [[row(0.5)], [row(0.5)]]
+    assert online_store.reads == 1
@@ -0,0 +1,319 @@
+import base64
+import hashlib
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+from feast.protos.feast.core.Entity_pb2 import Entity as EntityV2Proto
+from feast.protos.feast.core.Entity_pb2 import EntitySpecV2
+from feast.protos.feast.core.FeatureView_pb2 import FeatureView as FeatureViewProto
+from feast.protos.feast.core.FeatureView_pb2 import FeatureViewSpec
+from feast.protos.feast.core.Registry_pb2 import Registry as RegistryProto
+
+from feast_azure_provider import feature_store_client
+from feast_azure_provider.feature_store_client import (
+    RETRY_STATUS_CODES,
+    FeatureStoreClient,
+)
+
+
+@pytest.fixture
+def make_client(monkeypatch, tmp_path):
+    # init() bootstraps the local cache from the core service
+    monkeypatch.setattr(FeatureStoreClient, "init", lambda self: None)
+    monkeypatch.delenv("AZURE_CLIENT_ID", raising=False)
+
+    def make_client(**kwargs):
+        return FeatureStoreClient(
+            name="https://feast.example.com",
+            project_name="test",
+            local_cache_file_path=str(tmp_path / "registry.db"),
+            **kwargs,
+        )
+
+    return make_client
+
+
+# Prints the modules importing module loads on top of feast
+NEW_MODULES_SCRIPT = """
+import sys
+import feast.feature_store
+loaded = set(sys.modules)
+import {module}
+print(" ".join(set(sys.modules) - loaded))
+"""
+
+
+def imported_modules(module):
+    result = subprocess.run(
+        [sys.executable, "-c", NEW_MODULES_SCRIPT.format(module=module)],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    return set(result.stdout.split())
+
+
+def test_import_does_not_load_the_auth_libraries_or_store_configs():
+    modules = imported_modules("feast_azure_provider.feature_store_client")
+
+    assert "feast_azure_provider.feature_store_client" in modules
+    assert not modules & {
+        "msal",
+        "azure.identity",
+        "requests",
+        "feast_azure_provider.mssqlserver",
+        "feast.infra.online_stores.redis",
+    }
+
+
+def test_import_of_sources_does_not_load_sqlalchemy():
+    modules = imported_modules("feast_azure_provider.mssqlserver_source")
+
+    assert "feast_azure_provider.mssqlserver_source" in modules
+    assert "sqlalchemy" not in modules
+
+
+class FakeCredential:
+    def __init__(self):
+        self.requests = 0
+
+    def get_token(self, scope):
+        self.requests += 1
+        time.sleep(0.05)
+        return SimpleNamespace(
+            token=f"token{self.requests}", expires_on=time.time() + 3600
+        )
+
+
+def test_concurrent_requests_share_one_token_refresh(make_client):
+    client = make_client(aad_auth=True, aad_tenant_id="tenant", aad_client_id="client")
+    client._default_credential = FakeCredential()
+    start = threading.Barrier(8)
+
+    def request_header(_):
+        start.wait()
+        return client._get_request_header_internal()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        headers = list(executor.map(request_header, range(8)))
+
+    assert client._default_credential.requests == 1
+    assert headers == [{"authorization": "Bearer token1"}] * 8
+
+
+def test_expired_token_is_refreshed(make_client):
+    client = make_client(aad_auth=True, aad_tenant_id="tenant", aad_client_id="client")
+    client._default_credential = FakeCredential()
+    client._get_request_header_internal()
+
+    client._aad_token_expire_on = client._aad_token_expire_on.replace(year=2000)
+
+    assert client._get_request_header_internal() == {"authorization": "Bearer token2"}
+
+
+def test_http_session_is_shared_until_the_client_is_closed(make_client):
+    client = make_client(http_pool_size=4, http_retries=5, http_backoff_factor=0.25)
+    session = client._http
+
+    assert client._http is session
+    adapter = session.get_adapter("https://feast.example.com")
+    assert adapter._pool_maxsize == 4
+    assert adapter.max_retries.total == 5
+    assert adapter.max_retries.backoff_factor == 0.25
+    assert adapter.max_retries.status_forcelist == RETRY_STATUS_CODES
+
+    client.close()
+
+    assert client._http is not session
+
+
+def test_retries_wait_a_random_time_up_to_the_exponential_backoff(make_client):
+    from urllib3.util.retry import RequestHistory
+
+    client = make_client(http_backoff_factor=0.25)
+    retry = client._http.get_adapter("https://feast.example.com").max_retries
+    # After three failed requests the backoff is 0.25 * 2 ** 2 seconds
+    retry = retry.new(
+        history=tuple(RequestHistory("GET", "/", None, 503, None) for _ in range(3))
+    )
+
+    backoff_times = [retry.get_backoff_time() for _ in range(100)]
+
+    assert all(0 <= backoff_time <= 1.0 for backoff_time in backoff_times)
+    assert len(set(backoff_times)) > 1
+
+
+class FakeResponse:
+    def __init__(self, status_code, objects=None, etag=None):
+        self.status_code = status_code
+        self.objects = objects
+        self.headers = {"ETag": etag} if etag else {}
+
+    def json(self):
+        return self.objects
+
+
+class FakeCoreService:
+    """Serves the serialized protos of each collection of a project, with ETags"""
+
+    def __init__(self):
+        self.collections = {"entities": [], "featureviews": [], "featureservices": []}
+        self.requests = []
+        self.barrier = None
+
+    def get(self, url, headers):
+        collection = url.rsplit("/", 1)[-1]
+        self.requests.append((collection, headers.get("If-None-Match")))
+        if self.barrier is not None:
+            self.barrier.wait()
+        protos = self.collections[collection]
+        etag = '"%s"' % hashlib.sha1(b"".join(protos)).hexdigest()
+        if headers.get("If-None-Match") == etag:
+            return FakeResponse(304)
+        return FakeResponse(
+            200, [{"proto": base64.b64encode(proto).decode()} for proto in protos], etag
+        )
+
+
+class FakeRegistry:
+    def __init__(self, path):
+        self.path = path
+        self.registry_proto = RegistryProto()
+        self.commits = 0
+
+    def _prepare_registry_for_changes(self):
+        return self.registry_proto
+
+    def commit(self):
+        self.commits += 1
+        with open(self.path, "wb") as f:
+            f.write(self.registry_proto.SerializeToString())
+
+
+def entity(name, description=""):
+    return EntityV2Proto(
+        spec=EntitySpecV2(name=name, description=description)
+    ).SerializeToString()
+
+
+def feature_view(name):
+    return FeatureViewProto(spec=FeatureViewSpec(name=name)).SerializeToString()
+
+
+@pytest.fixture
+def synced_client(make_client, monkeypatch):
+    snapshots = []
+
+    def write_registry_snapshot(registry_proto, path):
+        snapshots.append(path)
+        open(path, "wb").close()
+
+    monkeypatch.setattr(
+        feature_store_client, "write_registry_snapshot", write_registry_snapshot
+    )
+    client = make_client()
+    client._http_session = FakeCoreService()
+    client.local = SimpleNamespace(
+        _registry=FakeRegistry(client._local_cache_file_path)
+    )
+    client.snapshots = snapshots
+    return client
+
+
+def test_collections_are_fetched_concurrently_and_committed_once(synced_client):
+    core = synced_client._http_session
+    core.collections["entities"] = [entity("driver"), entity("customer")]
+    core.collections["featureviews"] = [feature_view("driver_hourly")]
+    # Fetching the collections one after the other times out at the barrier
+    core.barrier = threading.Barrier(3, timeout=5)
+
+    synced_client._load_objects()
+
+    registry = synced_client.local._registry
+    assert registry.commits == 1
+    assert synced_client.snapshots == [synced_client.snapshot_path]
+    assert [proto.spec.name for proto in registry.registry_proto.entities] == [
+        "driver",
+        "customer",
+    ]
+    assert [proto.spec.project for proto in registry.registry_proto.entities] == [
+        "test",
+        "test",
+    ]
+    assert [proto.spec.name for proto in registry.registry_proto.feature_views] == [
+        "driver_hourly"
+    ]
+
+
+def test_unchanged_collections_are_not_fetched_again(synced_client):
+    core = synced_client._http_session
+    core.collections["entities"] = [entity("driver")]
+    synced_client._load_objects()
+    core.requests.clear()
+
+    synced_client._load_objects()
+
+    assert all(etag is not None for _, etag in core.requests)
+    assert synced_client.local._registry.commits == 1
+    assert len(synced_client.snapshots) == 1
+
+
+def test_only_changed_objects_are_decoded(synced_client, monkeypatch):
+    core = synced_client._http_session
+    core.collections["entities"] = [entity("driver"), entity("customer")]
+    synced_client._load_objects()
+    decoded = []
+    monkeypatch.setattr(
+        feature_store_client,
+        "EntityV2Proto",
+        lambda: decoded.append(1) or EntityV2Proto(),
+    )
+
+    core.collections["entities"] = [
+        entity("driver", description="updated"),
+        entity("customer"),
+        entity("trip"),
+    ]
+    synced_client._load_objects()
+
+    assert len(decoded) == 2
+    registry = synced_client.local._registry
+    assert registry.commits == 2
+    assert {
+        proto.spec.name: proto.spec.description
+        for proto in registry.registry_proto.entities
+    } == {"driver": "updated", "customer": "", "trip": ""}
+
+
+def test_objects_deleted_from_the_core_service_are_removed(synced_client):
+    core = synced_client._http_session
+    core.collections["entities"] = [entity("driver"), entity("customer")]
+    synced_client._load_objects()
+
+    core.collections["entities"] = [entity("customer")]
+    synced_client._load_objects()
+
+    entities = synced_client.local._registry.registry_proto.entities
+    assert [proto.spec.name for proto in entities] == ["customer"]
+
+
+def test_sync_state_is_ignored_without_the_local_cache(synced_client):
+    core = synced_client._http_session
+    core.collections["entities"] = [entity("driver")]
+    synced_client._load_objects()
+    assert os.path.exists(synced_client._sync_state_path)
+
+    os.remove(synced_client._local_cache_file_path)
+    synced_client.local._registry.registry_proto = RegistryProto()
+    core.requests.clear()
+    synced_client._load_objects()
+
+    assert all(etag is None for _, etag in core.requests)
+    entities = synced_client.local._registry.registry_proto.entities
+    assert [proto.spec.name for proto in entities] == ["driver"]
@@ -0,0 +1,594 @@
+import dataclasses
+import re
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pandas
+import pyarrow
+import pytest
+
+from feast_azure_provider import mssqlserver
+from feast_azure_provider.mssqlserver import (
+    POINT_IN_TIME_TEMP_TABLES_SETUP,
+    FeatureViewQueryContext,
+    MsSqlServerOfflineStore,
+    MsSqlServerParallelRetrievalJob,
+    MsSqlServerRetrievalJob,
+    Watermark,
+    _entity_table_columns,
+    _get_entity_df_timestamp_bounds,
+    _upload_entity_df_into_sqlserver_and_get_entity_schema,
+    build_feature_view_as_of_queries,
+    build_point_in_time_query,
+)
+from feast_azure_provider.mssqlserver_source import MsSqlServerSource
+
+
+class FakeCursor:
+    def __init__(self, description, rows):
+        self.description = description
+        self._rows = list(rows)
+        self.executed = []
+
+    def execute(self, query):
+        if query == "FAIL":
+            raise RuntimeError("query failed")
+        self.executed.append(query)
+
+    def fetchmany(self, size):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.closed = False
+
+    def cursor(self):
+        return self._cursor
+
+    def close(self):
+        self.closed = True
+
+
+class FakeEngine:
+    def __init__(self, cursor):
+        self.connection = FakeConnection(cursor)
+        self.dropped = []
+
+    def raw_connection(self):
+        return self.connection
+
+    @contextmanager
+    def begin(self):
+        # The entity table is dropped on a connection of its own
+        assert self.connection.closed
+        yield self
+
+    def exec_driver_sql(self, query):
+        self.dropped.append(query)
+
+
+def retrieval_job(cursor, query="SELECT 1", **kwargs):
+    return MsSqlServerRetrievalJob(
+        query,
+        FakeEngine(cursor),
+        None,
+        full_feature_names=False,
+        on_demand_feature_views=None,
+        **kwargs,
+    )
+
+
+DESCRIPTION = [
+    ("driver_id", int, None, None, None, None, True),
+    ("conv_rate", float, None, None, None, None, True),
+    ("event_timestamp", object, None, None, None, None, True),
+]
+
+
+def test_empty_result_keeps_columns():
+    table = retrieval_job(FakeCursor(DESCRIPTION, []))._to_arrow_internal()
+
+    assert table.num_rows == 0
+    assert table.column_names == ["driver_id", "conv_rate", "event_timestamp"]
+    assert table.schema.field("driver_id").type == pyarrow.int64()
+    assert table.schema.field("conv_rate").type == pyarrow.float64()
+
+
+def test_batches_with_all_null_columns_are_unified():
+    rows = [(1, None, None), (2, None, None), (3, 0.5, "Berlin")]
+    description = DESCRIPTION[:2] + [("city", object, None, None, None, None, True)]
+    table = retrieval_job(
+        FakeCursor(description, rows), arrow_batch_size=2
+    )._to_arrow_internal()
+
+    assert table.num_rows == 3
+    assert table.schema.field("conv_rate").type == pyarrow.float64()
+    assert table.schema.field("city").type == pyarrow.string()
+    assert table.column("city").to_pylist() == [None, None, "Berlin"]
+
+
+def test_temp_tables_setup_turns_row_counts_off():
+    # pyodbc stops at the first row count of a multi-statement batch
+    statements = POINT_IN_TIME_TEMP_TABLES_SETUP.split("*/", 1)[1].strip()
+    assert statements.startswith("SET NOCOUNT ON;")
+
+
+def test_cleanup_queries_run_when_batches_are_abandoned():
+    cursor = FakeCursor(DESCRIPTION, [(i, 0.5, None) for i in range(10)])
+    job = retrieval_job(
+        cursor, setup_queries=["SETUP"], cleanup_queries=["CLEANUP"], arrow_batch_size=2
+    )
+    batches = job.to_arrow_batches()
+    next(batches)
+    batches.close()
+
+    assert cursor.executed == ["SETUP", "SELECT 1", "CLEANUP"]
+    assert job.engine.connection.closed
+
+
+def test_cleanup_queries_run_when_the_query_fails():
+    cursor = FakeCursor(DESCRIPTION, [])
+    job = retrieval_job(
+        cursor, query="FAIL", setup_queries=["SETUP"], cleanup_queries=["CLEANUP"]
+    )
+    with pytest.raises(RuntimeError):
+        job._to_arrow_internal()
+
+    assert cursor.executed == ["SETUP", "CLEANUP"]
+    assert job.engine.connection.closed
+
+
+def test_entity_table_is_dropped_after_the_query():
+    cursor = FakeCursor(DESCRIPTION, [(1, 0.5, None)])
+    job = retrieval_job(cursor, entity_table="feast_entity_df_1")
+    job._to_arrow_internal()
+
+    assert job.engine.dropped == ["DROP TABLE IF EXISTS feast_entity_df_1"]
+
+
+def test_indexed_strings_are_sized_to_their_values():
+    entity_df = pandas.DataFrame(
+        {
+            "driver": ["a", "bcd", None],
+            "customer_id": [1, 2, 3],
+            "event_timestamp": pandas.to_datetime(["2021-01-01"] * 3),
+            "label": ["x", "y", "z"],
+        }
+    )
+    column_types, index_columns = _entity_table_columns(
+        entity_df, ["driver", "customer_id", "event_timestamp"]
+    )
+
+    assert column_types == {
+        "driver": "NVARCHAR(3)",
+        "customer_id": "BIGINT",
+        "event_timestamp": "DATETIME2",
+        "label": "NVARCHAR(MAX)",
+    }
+    assert index_columns == ["driver", "customer_id", "event_timestamp"]
+
+
+def test_index_key_over_900_bytes_leaves_out_strings():
+    entity_df = pandas.DataFrame(
+        {
+            "driver": ["a" * 300],
+            "customer": ["b" * 200],
+            "event_timestamp": pandas.to_datetime(["2021-01-01"]),
+        }
+    )
+    column_types, index_columns = _entity_table_columns(
+        entity_df, ["driver", "customer", "event_timestamp"]
+    )
+
+    assert column_types["driver"] == "NVARCHAR(MAX)"
+    assert index_columns == ["event_timestamp"]
+
+
+# Two feature rows per driver with the same event and created timestamps
+TIED_FEATURE_ROWS = [
+    (1, "2021-01-01 00:00:00", "2021-01-01 00:01:00", 0.2),
+    (1, "2021-01-01 00:00:00", "2021-01-01 00:01:00", 0.1),
+    (2, "2021-01-01 00:00:00", "2021-01-01 00:01:00", 0.3),
+    (2, "2021-01-01 00:00:00", "2021-01-01 00:01:00", 0.4),
+]
+
+TIED_CONTEXT = FeatureViewQueryContext(
+    name="driver_stats",
+    ttl=0,
+    entities=["driver_id"],
+    features=["conv_rate"],
+    table_ref="features",
+    event_timestamp_column="event_timestamp",
+    created_timestamp_column="created",
+    table_subquery="features",
+    entity_selections=["driver_id AS driver_id"],
+)
+
+
+@pytest.fixture
+def tied_database():
+    # The parallel retrieval job reads on worker threads
+    connection = sqlite3.connect(":memory:", check_same_thread=False)
+    connection.execute(
+        "CREATE TABLE features (driver_id, event_timestamp, created, conv_rate)"
+    )
+    connection.executemany(
+        "INSERT INTO features VALUES (?, ?, ?, ?)", TIED_FEATURE_ROWS
+    )
+    connection.execute(
+        "CREATE TABLE entity_df (driver_id, event_timestamp, feast_entity_row_id)"
+    )
+    connection.executemany(
+        "INSERT INTO entity_df VALUES (?, ?, ?)",
+        [(1, "2021-01-02 00:00:00", 1), (2, "2021-01-02 00:00:00", 2)],
+    )
+    yield connection
+    connection.close()
+
+
+def read_sql_on_sqlite(query, connection):
+    # Timestamps are stored as text, which SQLite compares like SQL Server's datetimes
+    query = re.sub(r"CONVERT\(DATETIMEOFFSET, ('[^']*'), 120\)", r"\1", query)
+    return pandas.read_sql(query, connection)
+
+
+@pytest.mark.parametrize("pit_join_strategy", ["max_join", "window"])
+def test_point_in_time_join_breaks_timestamp_ties(tied_database, pit_join_strategy):
+    query = build_point_in_time_query(
+        [TIED_CONTEXT],
+        min_timestamp=datetime(2021, 1, 2),
+        max_timestamp=datetime(2021, 1, 2),
+        left_table_query_string="entity_df",
+        entity_df_event_timestamp_col="event_timestamp",
+        entity_df_columns=["driver_id", "event_timestamp"],
+        pit_join_strategy=pit_join_strategy,
+    )
+    result = read_sql_on_sqlite(query, tied_database).sort_values("driver_id")
+
+    assert result["conv_rate"].to_list() == [0.1, 0.3]
+
+
+def test_as_of_join_breaks_timestamp_ties(tied_database):
+    queries = build_feature_view_as_of_queries(
+        [TIED_CONTEXT],
+        min_timestamp=datetime(2021, 1, 2),
+        max_timestamp=datetime(2021, 1, 2),
+        full_feature_names=False,
+    )
+    job = MsSqlServerParallelRetrievalJob(
+        entity_query="SELECT * FROM entity_df",
+        feature_view_queries=queries,
+        query_contexts=[TIED_CONTEXT],
+        engine=None,
+        config=SimpleNamespace(max_parallel_queries=1),
+        entity_df_event_timestamp_col="event_timestamp",
+        entity_df_columns=["driver_id", "event_timestamp"],
+        full_feature_names=False,
+        on_demand_feature_views=None,
+    )
+    job._read_arrow = lambda query: pyarrow.Table.from_pandas(
+        read_sql_on_sqlite(query, tied_database)
+    )
+    result = job._to_df_internal().sort_values("driver_id")
+
+    assert result["conv_rate"].to_list() == [0.1, 0.3]
+
+
+class WatermarkEngine:
+    """Engine keeping the watermarks table in a dict"""
+
+    def __init__(self, max_watermark=None):
+        self.max_watermark = max_watermark
+        self.watermarks = {}
+
+    @contextmanager
+    def connect(self):
+        yield self
+
+    begin = connect
+
+    def execute(self, statement, parameters=None):
+        query = str(statement).strip()
+        if query.startswith("SELECT MAX("):
+            return SimpleNamespace(scalar=lambda: self.max_watermark)
+        if query.startswith("MERGE"):
+            key = (parameters["project"], parameters["feature_view"])
+            self.watermarks[key] = parameters["watermark"]
+        if query.startswith("SELECT watermark"):
+            key = (parameters["project"], parameters["feature_view"])
+            row = (self.watermarks[key],) if key in self.watermarks else None
+            return SimpleNamespace(fetchone=lambda: row)
+
+
+def watermark_store(engine):
+    store = MsSqlServerOfflineStore()
+    store._engine = engine
+    return store
+
+
+WATERMARK_CONFIG = SimpleNamespace(
+    offline_store=SimpleNamespace(
+        type="feast_azure_provider.mssqlserver.MsSqlServerOfflineStore"
+    )
+)
+WATERMARK_SOURCE = MsSqlServerSource(
+    table_ref="driver_stats", event_timestamp_column="event_timestamp"
+)
+
+
+@pytest.mark.parametrize(
+    "max_watermark, literal",
+    [
+        (12345, "12345"),
+        (Decimal("12345"), "12345"),
+        (
+            datetime(2021, 4, 12, 10, 59, 42),
+            "CONVERT(DATETIMEOFFSET, '2021-04-12 10:59:42', 120)",
+        ),
+        (b"\x00\x00\x00\x00\x00\x00\x07\xd1", "0x00000000000007d1"),
+    ],
+    ids=["int", "numeric", "datetime", "rowversion"],
+)
+def test_changed_rows_are_filtered_on_the_watermark_literal(max_watermark, literal):
+    store = watermark_store(WatermarkEngine(max_watermark))
+    watermark = store.get_current_watermark(
+        WATERMARK_CONFIG, WATERMARK_SOURCE, "updated"
+    )
+
+    job = store.pull_latest_from_table_or_query(
+        WATERMARK_CONFIG,
+        WATERMARK_SOURCE,
+        ["driver_id"],
+        ["conv_rate"],
+        "event_timestamp",
+        None,
+        datetime(2021, 4, 1),
+        datetime(2021, 4, 13),
+        changed_since=("updated", watermark),
+    )
+
+    assert f"WHERE changed_t.updated > {literal} AND" in job.query
+    assert Watermark.parse(watermark.serialize()) == watermark
+
+
+@pytest.mark.parametrize("max_watermark", ["12345", 1.5, True])
+def test_unsupported_watermark_columns_are_rejected(max_watermark):
+    store = watermark_store(WatermarkEngine(max_watermark))
+
+    with pytest.raises(ValueError, match="watermark_column"):
+        store.get_current_watermark(WATERMARK_CONFIG, WATERMARK_SOURCE, "updated")
+
+
+def test_empty_source_has_no_watermark():
+    store = watermark_store(WatermarkEngine())
+
+    assert (
+        store.get_current_watermark(WATERMARK_CONFIG, WATERMARK_SOURCE, "updated")
+        is None
+    )
+
+
+def test_recorded_watermark_is_replaced_by_the_next_materialization():
+    engine = WatermarkEngine()
+    store = watermark_store(engine)
+
+    assert store.get_materialization_watermark(WATERMARK_CONFIG, "p", "fv") is None
+    store.update_materialization_watermark(
+        WATERMARK_CONFIG, "p", "fv", Watermark.from_value(1)
+    )
+    store.update_materialization_watermark(
+        WATERMARK_CONFIG, "p", "fv", Watermark.from_value(2)
+    )
+
+    assert engine.watermarks == {("p", "fv"): "int:2"}
+    assert store.get_materialization_watermark(
+        WATERMARK_CONFIG, "p", "fv"
+    ) == Watermark.from_value(2)
+    assert store.get_materialization_watermark(WATERMARK_CONFIG, "p", "other") is None
+
+
+def test_unreadable_watermark_materializes_in_full():
+    engine = WatermarkEngine()
+    engine.watermarks[("p", "fv")] = "2021-04-12 10:59:42"
+
+    assert (
+        watermark_store(engine).get_materialization_watermark(
+            WATERMARK_CONFIG, "p", "fv"
+        )
+        is None
+    )
+
+
+def test_entity_hash_partition_filters_on_the_join_keys():
+    store = watermark_store(WatermarkEngine())
+
+    job = store.pull_latest_from_table_or_query(
+        WATERMARK_CONFIG,
+        WATERMARK_SOURCE,
+        ["driver_id", "city"],
+        ["conv_rate"],
+        "event_timestamp",
+        None,
+        datetime(2021, 4, 1),
+        datetime(2021, 4, 13),
+        entity_hash_partition=(1, 4),
+    )
+
+    assert "AND ABS(CAST(CHECKSUM(driver_id, city) AS BIGINT)) % 4 = 1" in job.query
+
+
+def test_date_partition_filter_uses_the_source_column_name():
+    source = MsSqlServerSource(
+        table_ref="driver_stats",
+        event_timestamp_column="event_timestamp",
+        field_mapping={"event_date": "date"},
+        date_partition_column="date",
+    )
+
+    job = watermark_store(WatermarkEngine()).pull_latest_from_table_or_query(
+        WATERMARK_CONFIG,
+        source,
+        ["driver_id"],
+        ["conv_rate"],
+        "event_timestamp",
+        None,
+        datetime(2021, 4, 1),
+        datetime(2021, 4, 13),
+    )
+
+    assert "AND event_date >= '2021-04-01' AND event_date < '2021-04-14'" in job.query
+
+
+class UploadCursor:
+    def __init__(self):
+        self.statements = []
+        self.fast_executemany = False
+
+    def execute(self, query):
+        self.statements.append(query)
+
+    def executemany(self, query, rows):
+        self.statements.append((query, rows, self.fast_executemany))
+
+    def close(self):
+        pass
+
+
+class UploadConnection(FakeConnection):
+    def __init__(self, cursor):
+        super().__init__(cursor)
+        self.committed = False
+
+    def commit(self):
+        self.committed = True
+
+
+def test_entity_dataframe_is_uploaded_in_chunks_before_indexing(monkeypatch):
+    monkeypatch.setattr(mssqlserver, "ENTITY_DF_UPLOAD_CHUNK_SIZE", 2)
+    cursor = UploadCursor()
+    engine = SimpleNamespace(
+        connection=UploadConnection(cursor),
+        dialect=SimpleNamespace(fast_executemany=True),
+    )
+    engine.raw_connection = lambda: engine.connection
+    entity_df = pandas.DataFrame(
+        {
+            "driver_id": [1001, 1002, 1003, 1004, 1005],
+            "rating": [4.5, None, 3.0, 5.0, 4.0],
+            "event_timestamp": pandas.to_datetime(
+                ["2021-04-12 10:59:42"] * 5
+            ).tz_localize("Europe/Berlin"),
+        }
+    )
+
+    schema, table_name = _upload_entity_df_into_sqlserver_and_get_entity_schema(
+        engine, None, entity_df, {"driver_id"}
+    )
+
+    create, *inserts, index = cursor.statements
+    assert create.startswith(f"CREATE TABLE {table_name} (")
+    assert "feast_entity_row_id BIGINT IDENTITY(1,1) NOT NULL" in create
+    assert [len(rows) for _, rows, _ in inserts] == [2, 2, 1]
+    assert all(fast_executemany for _, _, fast_executemany in inserts)
+    assert inserts[0][1][1] == (1002, None, pandas.Timestamp("2021-04-12 08:59:42"))
+    assert index == (
+        f"CREATE CLUSTERED INDEX IX_{table_name} ON {table_name} "
+        "([driver_id], [event_timestamp])"
+    )
+    assert engine.connection.committed and engine.connection.closed
+    assert schema == dict(zip(entity_df.columns, entity_df.dtypes))
+
+
+def test_feature_rows_are_bounded_by_the_entity_timestamps_and_ttl():
+    query = build_point_in_time_query(
+        [dataclasses.replace(TIED_CONTEXT, ttl=86400)],
+        min_timestamp=datetime(2021, 1, 2, tzinfo=timezone.utc),
+        max_timestamp=datetime(2021, 1, 5, tzinfo=timezone.utc),
+        left_table_query_string="entity_df",
+        entity_df_event_timestamp_col="event_timestamp",
+        entity_df_columns=["driver_id", "event_timestamp"],
+    )
+
+    assert (
+        "WHERE event_timestamp <= CONVERT(DATETIMEOFFSET, '2021-01-05 00:00:00+00:00', 120)"
+        in query
+    )
+    assert (
+        "AND event_timestamp >= CONVERT(DATETIMEOFFSET, '2021-01-01 00:00:00+00:00', 120)"
+        in query
+    )
+    assert "MAX(entity_timestamp)" not in query
+
+
+def test_entity_timestamp_bounds_of_a_dataframe():
+    entity_df = pandas.DataFrame(
+        {"event_timestamp": pandas.to_datetime(["2021-01-03", "2021-01-01"])}
+    )
+
+    assert _get_entity_df_timestamp_bounds(
+        None, entity_df, "entity_df", "event_timestamp"
+    ) == (
+        datetime(2021, 1, 1, tzinfo=timezone.utc),
+        datetime(2021, 1, 3, tzinfo=timezone.utc),
+    )
+
+
+def test_entity_timestamp_bounds_of_a_query_are_read_from_the_entity_table():
+    queries = []
+
+    @contextmanager
+    def connect():
+        def execute(statement):
+            queries.append(str(statement))
+            return SimpleNamespace(
+                fetchone=lambda: (datetime(2021, 1, 1), datetime(2021, 1, 3))
+            )
+
+        yield SimpleNamespace(execute=execute)
+
+    bounds = _get_entity_df_timestamp_bounds(
+        SimpleNamespace(connect=connect),
+        "SELECT * FROM drivers",
+        "entity_df",
+        "event_timestamp",
+    )
+
+    assert queries == [
+        "SELECT MIN(event_timestamp), MAX(event_timestamp) FROM entity_df"
+    ]
+    assert bounds == (
+        datetime(2021, 1, 1, tzinfo=timezone.utc),
+        datetime(2021, 1, 3, tzinfo=timezone.utc),
+    )
+
+
+@pytest.mark.parametrize("pit_join_strategy", ["max_join", "window"])
+def test_point_in_time_join_keys_entity_rows_by_their_row_id(
+    tied_database, pit_join_strategy
+):
+    # A duplicate entity row is joined on its own, not merged with its twin
+    tied_database.execute("INSERT INTO entity_df VALUES (1, '2021-01-02 00:00:00', 3)")
+    query = build_point_in_time_query(
+        [TIED_CONTEXT],
+        min_timestamp=datetime(2021, 1, 2),
+        max_timestamp=datetime(2021, 1, 2),
+        left_table_query_string="entity_df",
+        entity_df_event_timestamp_col="event_timestamp",
+        entity_df_columns=["driver_id", "event_timestamp"],
+        pit_join_strategy=pit_join_strategy,
+    )
+    result = read_sql_on_sqlite(query, tied_database).sort_values("driver_id")
+
+    assert "CONCAT" not in query
+    assert "feast_entity_row_id" in query
+    assert result["driver_id"].to_list() == [1, 1, 2]
+    assert result["conv_rate"].to_list() == [0.1, 0.1, 0.3]
@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+
+import pytest
+from feast.protos.feast.types.Value_pb2 import Value as ValueProto
+
+from feast_azure_provider import online_cache
+from feast_azure_provider.online_cache import OnlineFeatureCache
+
+TTL = timedelta(minutes=5)
+TIMESTAMP = datetime(2021, 4, 12, 10, 59, 42)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(online_cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def row(conv_rate, **features):
+    values = {"conv_rate": ValueProto(double_val=conv_rate)}
+    values.update(
+        (name, ValueProto(double_val=value)) for name, value in features.items()
+    )
+    return TIMESTAMP, values
+
+
+def entry_size(entity_key):
+    cache = OnlineFeatureCache(max_bytes=10_000)
+    cache.put("fv", entity_key, row(0.5), TTL)
+    return cache.size
+
+
+def test_least_recently_used_rows_are_evicted_past_max_bytes(clock):
+    cache = OnlineFeatureCache(max_bytes=3 * entry_size(b"1"))
+
+    for entity_key in [b"1", b"2", b"3"]:
+        cache.put("fv", entity_key, row(0.5), TTL)
+    assert cache.get("fv", b"1", ["conv_rate"]) is not None
+    cache.put("fv", b"4", row(0.5), TTL)
+
+    assert cache.get("fv", b"2", ["conv_rate"]) is None
+    for entity_key in [b"1", b"3", b"4"]:
+        assert cache.get("fv", entity_key, ["conv_rate"]) is not None
+    assert cache.stats()["evictions"] == 1
+    assert cache.size <= cache.max_bytes
+
+
+def test_rows_larger_than_max_bytes_are_not_cached(clock):
+    cache = OnlineFeatureCache(max_bytes=10)
+    cache.put("fv", b"1", row(0.5), TTL)
+
+    assert cache.get("fv", b"1", ["conv_rate"]) is None
+    assert cache.size == 0
+
+
+def test_rows_expire_after_their_ttl(clock):
+    cache = OnlineFeatureCache(max_bytes=10_000)
+    cache.put("fv", b"1", row(0.5), TTL)
+
+    clock[0] += TTL.total_seconds() - 1
+    assert cache.get("fv", b"1", ["conv_rate"]) == row(0.5)
+    clock[0] += 1
+    assert cache.get("fv", b"1", ["conv_rate"]) is None
+    assert cache.size == 0
+
+
+def test_rows_missing_requested_features_are_misses(clock):
+    cache = OnlineFeatureCache(max_bytes=10_000)
+    cache.put("fv", b"1", row(0.5), TTL)
+    cache.put("fv", b"1", row(0.5, avg_daily_trips=10.0), TTL)
+
+    assert cache.get("fv", b"1", ["conv_rate", "acc_rate"]) is None
+    assert cache.get("fv", b"1", ["avg_daily_trips", "conv_rate"]) == row(
+        0.5, avg_daily_trips=10.0
+    )
+
+
+def test_invalidate_drops_only_the_feature_view(clock):
+    cache = OnlineFeatureCache(max_bytes=10_000)
+    cache.put("fv", b"1", row(0.5), TTL)
+    cache.put("other_fv", b"1", row(0.5), TTL)
+
+    cache.invalidate("fv")
+
+    assert cache.get("fv", b"1", ["conv_rate"]) is None
+    assert cache.get("other_fv", b"1", ["conv_rate"]) is not None
+    assert cache.stats()["entries"] == 1
@@ -0,0 +1,133 @@
+import os
+import time
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pyarrow
+import pytest
+
+from feast import Entity, Feature, FeatureView, FileSource, ValueType
+from feast.infra.online_stores.helpers import _mmh3, _redis_key
+from feast.infra.provider import _convert_arrow_to_proto
+from google.protobuf.timestamp_pb2 import Timestamp
+
+from feast_azure_provider.proto_conversion import (
+    convert_arrow_to_proto,
+    serialize_arrow_for_redis,
+)
+
+# Compares feast's row-by-row Arrow to proto conversion and Redis serialization with
+# the columnar implementations in feast_azure_provider.proto_conversion. Run as a
+# script to print the timings for larger tables.
+SIZES = [10_000, 100_000, 1_000_000]
+PROJECT = "benchmark"
+
+# CPU time the columnar conversion and serialization must save at least
+MIN_SPEEDUP = 5
+
+driver = Entity(name="driver_id", value_type=ValueType.INT64)
+driver_stats = FeatureView(
+    name="driver_stats",
+    entities=["driver_id"],
+    ttl=timedelta(days=1),
+    features=[
+        Feature(name="conv_rate", dtype=ValueType.DOUBLE),
+        Feature(name="trips", dtype=ValueType.INT64),
+        Feature(name="city", dtype=ValueType.STRING),
+        Feature(name="active", dtype=ValueType.BOOL),
+    ],
+    batch_source=FileSource(
+        path="unused",
+        event_timestamp_column="event_timestamp",
+        created_timestamp_column="created",
+    ),
+)
+
+
+def make_table(size):
+    timestamps = pd.Timestamp("2021-01-01", tz="UTC") + pd.to_timedelta(
+        np.random.randint(0, 30 * 24 * 3600, size=size), unit="s"
+    )
+    return pyarrow.Table.from_pandas(
+        pd.DataFrame(
+            {
+                "driver_id": np.arange(size),
+                "conv_rate": np.random.rand(size),
+                "trips": np.random.randint(0, 1000, size=size),
+                "city": np.random.choice(["Seattle", "Redmond", "Bellevue"], size),
+                "active": np.random.rand(size) > 0.5,
+                "event_timestamp": timestamps,
+                "created": timestamps,
+            }
+        ),
+        preserve_index=False,
+    )
+
+
+def serialize_rows_for_redis(rows):
+    """The serialization RedisOnlineStore.online_write_batch does for every row"""
+    ex = Timestamp()
+    ex.seconds = 253402300799
+    ex_str = ex.SerializeToString()
+    serialized = []
+    for entity_key, values, timestamp, _ in rows:
+        ts = Timestamp()
+        ts.seconds = int(timestamp.timestamp())
+        entity_hset = {
+            f"_ts:{driver_stats.name}": ts.SerializeToString(),
+            f"_ex:{driver_stats.name}": ex_str,
+        }
+        for feature_name, val in values.items():
+            f_key = _mmh3(f"{driver_stats.name}:{feature_name}")
+            entity_hset[f_key] = val.SerializeToString()
+        serialized.append((_redis_key(PROJECT, entity_key), entity_hset))
+    return serialized
+
+
+def convert_row_by_row(table):
+    rows = _convert_arrow_to_proto(table, driver_stats, ["driver_id"])
+    return rows, serialize_rows_for_redis(rows)
+
+
+def convert_columnar(table):
+    rows = convert_arrow_to_proto(table, driver_stats, ["driver_id"])
+    return rows, serialize_arrow_for_redis(table, driver_stats, ["driver_id"], PROJECT)
+
+
+def cpu_time(convert, table, repeat=3):
+    """Returns the lowest CPU time of repeat conversions of table"""
+    cpu_times = []
+    for _ in range(repeat):
+        began = time.process_time()
+        convert(table)
+        cpu_times.append(time.process_time() - began)
+    return min(cpu_times)
+
+
+def test_columnar_conversion_matches_feast():
+    table = make_table(1_000)
+
+    assert convert_columnar(table) == convert_row_by_row(table)
+
+
+@pytest.mark.skipif(
+    not os.environ.get("RUN_BENCHMARKS"),
+    reason="timing dependent, set RUN_BENCHMARKS=1 to run it",
+)
+def test_columnar_conversion_saves_cpu_time():
+    table = make_table(100_000)
+    speedup = cpu_time(convert_row_by_row, table) / cpu_time(convert_columnar, table)
+
+    assert speedup >= MIN_SPEEDUP, f"columnar conversion is only {speedup:.1f}x faster"
+
+
+if __name__ == "__main__":
+    for size in SIZES:
+        table = make_table(size)
+        row_by_row = cpu_time(convert_row_by_row, table, repeat=1)
+        columnar = cpu_time(convert_columnar, table, repeat=1)
+        print(
+            f"{size} rows: row by row {row_by_row:.2f}s, columnar {columnar:.2f}s "
+            f"CPU time, {row_by_row / columnar:.1f}x faster"
+        )
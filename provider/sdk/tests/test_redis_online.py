@@ -0,0 +1,82 @@
+from datetime import datetime
+
+from feast.infra.online_stores.helpers import _mmh3, _redis_key
+from feast.protos.feast.types.EntityKey_pb2 import EntityKey as EntityKeyProto
+from feast.protos.feast.types.Value_pb2 import Value as ValueProto
+from google.protobuf.timestamp_pb2 import Timestamp
+
+from feast_azure_provider.redis_online import read_from_redis
+
+TIMESTAMP = datetime(2021, 4, 12, 10, 59, 42)
+
+
+def entity_key(driver_id):
+    return EntityKeyProto(
+        join_keys=["driver_id"], entity_values=[ValueProto(int64_val=driver_id)]
+    )
+
+
+class FakePipeline:
+    def __init__(self, hashes):
+        self.hashes = hashes
+        self.commands = []
+
+    def hmget(self, key, fields):
+        self.commands.append((key, fields))
+
+    def execute(self):
+        return [
+            [self.hashes.get(key, {}).get(field) for field in fields]
+            for key, fields in self.commands
+        ]
+
+
+class FakeRedis:
+    def __init__(self, hashes):
+        self.hashes = hashes
+        self.pipelines = []
+
+    def pipeline(self, transaction):
+        assert not transaction
+        pipeline = FakePipeline(self.hashes)
+        self.pipelines.append(pipeline)
+        return pipeline
+
+
+def feature_hash(conv_rate):
+    timestamp = Timestamp()
+    timestamp.FromDatetime(TIMESTAMP)
+    return {
+        _mmh3("driver_stats:conv_rate"): ValueProto(
+            double_val=conv_rate
+        ).SerializeToString(),
+        _mmh3("driver_stats:trips"): ValueProto(int64_val=10).SerializeToString(),
+        "_ts:driver_stats": timestamp.SerializeToString(),
+    }
+
+
+def test_batch_is_read_in_one_pipeline_of_requested_fields():
+    client = FakeRedis(
+        {
+            _redis_key("test", entity_key(1001)): feature_hash(0.5),
+            _redis_key("test", entity_key(1002)): feature_hash(0.7),
+        }
+    )
+
+    rows = read_from_redis(
+        client,
+        "test",
+        "driver_stats",
+        [entity_key(1001), entity_key(1002), entity_key(1003)],
+        ["conv_rate"],
+    )
+
+    (pipeline,) = client.pipelines
+    assert [fields for _, fields in pipeline.commands] == [
+        [_mmh3("driver_stats:conv_rate"), "_ts:driver_stats"]
+    ] * 3
+    assert [values for _, values in rows[:2]] == [
+        {"conv_rate": ValueProto(double_val=0.5)},
+        {"conv_rate": ValueProto(double_val=0.7)},
+    ]
+    assert rows[2] == (None, None)
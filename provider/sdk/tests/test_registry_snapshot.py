@@ -0,0 +1,80 @@
+import pytest
+from feast.errors import EntityNotFoundException
+from feast.protos.feast.core.Registry_pb2 import Registry as RegistryProto
+
+from feast_azure_provider.registry_snapshot import (
+    ReadOnlyRegistryError,
+    SnapshotRegistry,
+    write_registry_snapshot,
+)
+
+
+def registry_proto(*entity_names, project="test"):
+    registry_proto = RegistryProto()
+    for name in entity_names:
+        entity_proto = registry_proto.entities.add()
+        entity_proto.spec.name = name
+        entity_proto.spec.project = project
+    return registry_proto
+
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    path = str(tmp_path / "registry.snapshot")
+    write_registry_snapshot(registry_proto("driver", "customer"), path)
+    return path
+
+
+def test_objects_are_looked_up_in_the_snapshot(snapshot_path):
+    registry = SnapshotRegistry(snapshot_path)
+
+    assert [entity.name for entity in registry.list_entities("test")] == [
+        "driver",
+        "customer",
+    ]
+    assert registry.get_entity("customer", "test").name == "customer"
+    assert registry.list_entities("other") == []
+    with pytest.raises(EntityNotFoundException):
+        registry.get_entity("trip", "test")
+
+
+def test_replaced_snapshot_is_reopened_on_refresh(snapshot_path):
+    registry = SnapshotRegistry(snapshot_path)
+    registry.list_entities("test")
+    previous_snapshot = registry._registry_store._snapshot
+
+    write_registry_snapshot(registry_proto("trip"), snapshot_path)
+
+    assert len(registry.list_entities("test", allow_cache=True)) == 2
+    registry.refresh()
+    assert [
+        entity.name for entity in registry.list_entities("test", allow_cache=True)
+    ] == ["trip"]
+    assert previous_snapshot._mmap.closed
+
+
+def test_lookups_without_the_cache_reopen_a_replaced_snapshot(snapshot_path):
+    registry = SnapshotRegistry(snapshot_path)
+    registry.list_entities("test")
+
+    write_registry_snapshot(registry_proto("trip"), snapshot_path)
+
+    assert registry.get_entity("trip", "test").name == "trip"
+    assert [
+        entity_proto.spec.name
+        for entity_proto in registry._get_registry_proto().entities
+    ] == ["trip"]
+
+
+def test_changes_raise_read_only_registry_error(snapshot_path):
+    registry = SnapshotRegistry(snapshot_path)
+
+    for change in [
+        registry.commit,
+        registry.teardown,
+        lambda: registry.delete_feature_view("driver_hourly", "test"),
+        lambda: registry.delete_feature_service("driver_activity", "test"),
+        lambda: registry._registry_store.update_registry_proto(RegistryProto()),
+    ]:
+        with pytest.raises(ReadOnlyRegistryError):
+            change()
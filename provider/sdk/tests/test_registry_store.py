@@ -0,0 +1,168 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+from azure.core import MatchConditions
+from azure.core.exceptions import (
+    ResourceModifiedError,
+    ResourceNotFoundError,
+    ResourceNotModifiedError,
+)
+from feast.protos.feast.core.Registry_pb2 import Registry as RegistryProto
+from feast.repo_config import RegistryConfig
+
+from feast_azure_provider import registry_store
+from feast_azure_provider.registry_store import AzBlobRegistryStore
+
+REGISTRY_PATH = "https://account.blob.core.windows.net/container/registry.db"
+
+
+class FakeBlob:
+    """Blob with ETags, whose downloads wait until release is set"""
+
+    def __init__(self):
+        self.data = None
+        self.version = 0
+        self.downloads = []
+        self.conditions = []
+        self.release = threading.Event()
+        self.release.set()
+
+    @property
+    def etag(self):
+        return f'"{self.version}"'
+
+    def download_blob(self, etag=None, match_condition=None):
+        self.downloads.append(threading.current_thread())
+        self.conditions.append((etag, match_condition))
+        self.release.wait()
+        if self.data is None:
+            raise ResourceNotFoundError()
+        if etag == self.etag:
+            raise ResourceNotModifiedError()
+        data = self.data
+        return SimpleNamespace(
+            readall=lambda: data, properties=SimpleNamespace(etag=self.etag)
+        )
+
+    def upload_blob(self, data, overwrite, etag=None, match_condition=None):
+        if etag is not None and etag != self.etag:
+            raise ResourceModifiedError()
+        self.data = data
+        self.version += 1
+        return {"etag": self.etag}
+
+
+@pytest.fixture(autouse=True)
+def snapshot_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(registry_store, "REGISTRY_SNAPSHOT_DIR", str(tmp_path))
+
+
+def make_store(blob):
+    store = AzBlobRegistryStore(RegistryConfig(path=REGISTRY_PATH), None)
+    store._blob = blob
+    return store
+
+
+def write_registry(store, schema_version):
+    store.update_registry_proto(RegistryProto(registry_schema_version=schema_version))
+
+
+def test_blob_client_is_created_on_first_use(monkeypatch):
+    clients = []
+    monkeypatch.setattr(
+        AzBlobRegistryStore,
+        "_create_blob_client",
+        lambda self: clients.append(FakeBlob()) or clients[-1],
+    )
+    store = AzBlobRegistryStore(RegistryConfig(path=REGISTRY_PATH), None)
+    assert clients == []
+
+    assert store.blob is clients[0]
+    assert store.blob is clients[0]
+    assert len(clients) == 1
+
+
+def test_reads_do_not_wait_for_the_blob_when_a_snapshot_exists():
+    blob = FakeBlob()
+    write_registry(make_store(blob), "1")
+
+    reader = make_store(blob)
+    blob.release.clear()
+    registry_proto = reader.get_registry_proto()
+
+    assert registry_proto.registry_schema_version == "1"
+    assert threading.current_thread() not in blob.downloads
+    blob.release.set()
+    reader._refresh_thread.join()
+
+
+def test_newer_registry_is_returned_after_the_background_refresh():
+    blob = FakeBlob()
+    writer = make_store(blob)
+    write_registry(writer, "1")
+    reader = make_store(blob)
+    write_registry(writer, "2")
+
+    assert reader.get_registry_proto().registry_schema_version == "1"
+    reader._refresh_thread.join()
+    assert reader.get_registry_proto().registry_schema_version == "2"
+    reader._refresh_thread.join()
+    assert len(blob.downloads) == 2
+
+
+def test_changes_to_a_stale_registry_are_rejected_and_the_registry_refreshed():
+    blob = FakeBlob()
+    writer = make_store(blob)
+    write_registry(writer, "1")
+    reader = make_store(blob)
+    registry_proto = reader.get_registry_proto()
+    reader._refresh_thread.join()
+    write_registry(writer, "2")
+    # The background refresh sees the new version before the stale changes are written
+    reader.get_registry_proto()
+    reader._refresh_thread.join()
+
+    registry_proto.registry_schema_version = "stale"
+    with pytest.raises(ResourceModifiedError):
+        reader.update_registry_proto(registry_proto)
+
+    assert reader.get_registry_proto().registry_schema_version == "2"
+
+
+def test_written_registry_is_not_changed_by_the_caller():
+    store = make_store(FakeBlob())
+    registry_proto = RegistryProto(registry_schema_version="1")
+    store.update_registry_proto(registry_proto)
+
+    registry_proto.registry_schema_version = "changed"
+
+    assert store.get_registry_proto().registry_schema_version == "1"
+    store._refresh_thread.join()
+
+
+def test_missing_registry_raises_file_not_found():
+    with pytest.raises(FileNotFoundError):
+        make_store(FakeBlob()).get_registry_proto()
+
+
+def test_registry_without_a_snapshot_is_downloaded_unconditionally():
+    blob = FakeBlob()
+    blob.data = RegistryProto(registry_schema_version="1").SerializeToString()
+    blob.version = 1
+
+    assert make_store(blob).get_registry_proto().registry_schema_version == "1"
+    assert blob.conditions == [(None, None)]
+
+
+def test_unchanged_registry_is_not_downloaded_or_parsed_again():
+    blob = FakeBlob()
+    write_registry(make_store(blob), "1")
+    reader = make_store(blob)
+
+    registry_proto = reader.get_registry_proto()
+    reader._refresh_thread.join()
+
+    assert blob.conditions == [('"1"', MatchConditions.IfModified)]
+    assert reader.get_registry_proto() is registry_proto
+    reader._refresh_thread.join()